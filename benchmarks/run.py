@@ -0,0 +1,247 @@
+"""
+Module Overview
+---------------
+This module runs the offline benchmark suite and compares its results with a baseline.
+For every scale, the bundled CSV files are replicated into a synthetic dataset, the startup time is measured in fresh
+processes, and the rest of the pipeline (CSV ingest, query rewriting, the SQL tool end to end, null value replacement,
+result encoding and prompt rendering) is measured by `benchmarks/worker.py` in a process configured for that dataset. No call is made
+to OpenAI: the LLM cache is disabled and the few-shot examples are embedded with a local hashing model.
+The results are written as JSON, and can be compared with the results of another commit to catch regressions.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: Functions to run the processes of a scale and to describe the environment.
+- Comparison: A function to compare results with a baseline.
+- Main: The command line interface.
+
+Example usage:
+    # Record a baseline
+    python -m benchmarks.run --scales 10 100 1000 --output benchmarks/baseline.json
+
+    # Measure a change and fail if any median is more than 25% slower than the baseline
+    python -m benchmarks.run --scales 10 100 1000 --output results.json --compare benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_scaled_csvs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_MODULES = {
+    "startup_sql_tool": "src.tools.sql",
+    "startup_agent": "src.agent",
+}
+
+
+def scale_environment(folder: str) -> dict:
+    return {
+        **os.environ,
+        "SQL_AGENT_CSV_FOLDER": folder,
+        "SQL_AGENT_DB_PATH": os.path.join(folder, "database.db"),
+        "FEW_SHOT_INDEX_DIR": os.path.join(folder, "few_shot_index"),
+        "LLM_CACHE": "off",
+        "HISTORY_BACKEND": "memory",
+        # The client is built at startup but never called
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+    }
+
+
+def measure_startup(module: str, environment: dict, repeat: int) -> dict:
+    """
+    Times the import of a module in fresh processes, once the database is ingested.
+
+    Args:
+        module (str): The module to import.
+        environment (dict): The environment of the processes.
+        repeat (int): The number of processes.
+
+    Returns:
+        dict: The median, minimum, mean and maximum import time in milliseconds.
+    """
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            env=environment,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "mean_ms": statistics.fmean(times) * 1000,
+        "max_ms": max(times) * 1000,
+        "calls_per_round": 1,
+        "rounds": repeat,
+    }
+
+
+def run_scale(scale: int, work_dir: str, repeat: int, ingest_repeat: int) -> dict:
+    """
+    Runs every benchmark on the dataset of a scale.
+
+    Args:
+        scale (int): The number of copies of the bundled CSV files.
+        work_dir (str): The folder the synthetic datasets are written to.
+        repeat (int): The number of rounds of each benchmark.
+        ingest_repeat (int): The number of rounds of the ingest benchmark.
+
+    Returns:
+        dict: The number of rows per CSV file and the timings of each benchmark.
+    """
+    folder = os.path.join(work_dir, f"{scale}x")
+    print(f"Generating the {scale}x dataset in {folder}", file=sys.stderr)
+    rows = write_scaled_csvs(os.path.join(ROOT, "data"), folder, scale)
+    environment = scale_environment(folder)
+
+    # Ingests the dataset, so the startup is measured with the tables up to date
+    subprocess.run(
+        [sys.executable, "-c", "import src.tools.sql"],
+        cwd=ROOT,
+        env=environment,
+        check=True,
+        capture_output=True,
+    )
+
+    results = {"rows": rows}
+    for name, module in STARTUP_MODULES.items():
+        print(f"Measuring {name} at {scale}x", file=sys.stderr)
+        results[name] = measure_startup(module, environment, repeat)
+
+    print(f"Measuring the pipeline at {scale}x", file=sys.stderr)
+    output = os.path.join(folder, "results.json")
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.worker",
+            "--output",
+            output,
+            "--repeat",
+            str(repeat),
+            "--ingest-repeat",
+            str(ingest_repeat),
+        ],
+        cwd=ROOT,
+        env=environment,
+        check=True,
+    )
+    with open(output, encoding="utf-8") as file:
+        results.update(json.load(file))
+    return results
+
+
+def describe_environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compares the median timings of two result files.
+
+    Args:
+        results (dict): The new results.
+        baseline (dict): The results to compare against.
+        threshold (float): The relative slowdown above which a benchmark is reported as a regression.
+
+    Returns:
+        list[str]: The benchmarks that regressed, as "<scale>x/<benchmark>".
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for scale, benchmarks in results["scales"].items():
+        baseline_benchmarks = baseline.get("scales", {}).get(scale, {})
+        for name, timing in benchmarks.items():
+            if name == "rows" or name not in baseline_benchmarks:
+                continue
+            before = baseline_benchmarks[name]["median_ms"]
+            after = timing["median_ms"]
+            change = after / before - 1 if before else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{scale}x/{name}")
+            print(
+                f"{scale + 'x/' + name:<40} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the offline benchmark suite.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ingest-repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument(
+        "--work-dir",
+        help="Where the datasets are generated, a temporary folder by default",
+    )
+    parser.add_argument(
+        "--compare", metavar="BASELINE", help="Result file to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="react-agent-benchmarks-")
+    results = {
+        "environment": describe_environment(),
+        "scales": {
+            str(scale): run_scale(scale, work_dir, args.repeat, args.ingest_repeat)
+            for scale in args.scales
+        },
+    }
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
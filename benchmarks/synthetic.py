@@ -0,0 +1,97 @@
+"""
+Module Overview
+---------------
+This module generates the synthetic datasets the benchmarks run against.
+The bundled CSV files are replicated a given number of times, with the client identifiers shifted on every copy, so a
+scaled dataset has the same columns, value distributions and null patterns as the real one, but `scale` times as many
+rows and clients.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Functions: Functions to write the scaled copy of every CSV file.
+
+Example usage:
+    from benchmarks.synthetic import write_scaled_csvs
+
+    # 100 times the rows of data/*.csv, written to /tmp/bench/100x
+    write_scaled_csvs("data", "/tmp/bench/100x", scale=100)
+"""
+
+import csv
+import os
+import re
+
+__all__ = ["write_scaled_csvs"]
+
+CLIENT_PATTERN = re.compile(r"^(\D+)(\d+)$")
+
+
+def shift_client(client: str, offset: int) -> str:
+    """
+    Shifts the number of a client identifier, e.g. Client_7 becomes Client_1007 for an offset of 1000.
+    Identifiers without a number, including nulls and misspellings, are kept as they are.
+    """
+    match = CLIENT_PATTERN.match(client)
+    if match is None or offset == 0:
+        return client
+    return f"{match.group(1)}{int(match.group(2)) + offset}"
+
+
+def write_scaled_csv(source: str, target: str, scale: int) -> int:
+    """
+    Writes `scale` copies of the rows of a CSV file, shifting the clients of every copy.
+
+    Args:
+        source (str): The path of the CSV file to replicate.
+        target (str): The path of the scaled CSV file.
+        scale (int): The number of copies.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with open(source, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = list(reader)
+
+    client_index = header.index("Client") if "Client" in header else None
+    # Leaves room for every client number of the source file
+    stride = 10 ** len(str(len(rows)))
+
+    with open(target, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for copy in range(scale):
+            if client_index is None:
+                writer.writerows(rows)
+                continue
+            for row in rows:
+                row = list(row)
+                row[client_index] = shift_client(row[client_index], copy * stride)
+                writer.writerow(row)
+    return len(rows) * scale
+
+
+def write_scaled_csvs(source_folder: str, target_folder: str, scale: int) -> dict:
+    """
+    Writes the scaled copy of every CSV file of a folder.
+
+    Args:
+        source_folder (str): The folder containing the bundled CSV files.
+        target_folder (str): The folder the scaled CSV files are written to.
+        scale (int): The number of copies of every file.
+
+    Returns:
+        dict: The number of rows written per file name.
+    """
+    os.makedirs(target_folder, exist_ok=True)
+    rows = {}
+    for file_name in sorted(os.listdir(source_folder)):
+        if file_name.endswith(".csv"):
+            rows[file_name] = write_scaled_csv(
+                os.path.join(source_folder, file_name),
+                os.path.join(target_folder, file_name),
+                scale,
+            )
+    return rows
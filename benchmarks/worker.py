@@ -0,0 +1,208 @@
+"""
+Module Overview
+---------------
+This module runs the in-process benchmarks of a single dataset scale.
+The settings of the application are read from the environment when `src` is first imported, so every scale runs in
+its own process, started by `benchmarks/run.py` with the database, the CSV folder and the caches pointed at the
+synthetic dataset. The timings are written as JSON to the output file.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: The timing helper and an offline embedding model for the few-shot prompt.
+- Benchmarks: One function per measured part of the pipeline.
+- Main: Running every benchmark and writing the results.
+
+Example usage:
+    SQL_AGENT_CSV_FOLDER=/tmp/bench/10x SQL_AGENT_DB_PATH=/tmp/bench/10x/database.db \\
+        python -m benchmarks.worker --output /tmp/bench/10x/results.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import timeit
+
+from langchain_core.embeddings import Embeddings
+
+__all__ = ["measure"]
+
+QUERIES = [
+    'SELECT "Client", "Target Allocation (%)" FROM allocations WHERE "Asset Class" = \'Stocks\';',
+    'SELECT "Client", "Asset Class" FROM allocations WHERE "Target Portfolio" = \'Balanced\';',
+    'SELECT "Asset Class", SUM("Target Allocation (%)") AS "Total Allocation" FROM allocations WHERE "Client" = \'Client_1\' GROUP BY "Asset Class";',
+    'SELECT "Client", SUM("Market Value") FROM advisors_clients GROUP BY "Client" ORDER BY 2 DESC LIMIT 10;',
+    'SELECT DISTINCT "Client" FROM advisors_clients WHERE "Symbol" = \'TSLA\';',
+    'SELECT a."Client", a."Target Portfolio", c."Symbol" FROM allocations a JOIN advisors_clients c ON a."Client" = c."Client" WHERE a."Client" = \'Client_2\';',
+    "SELECT * FROM allocations WHERE \"Client\" = 'Client_3';",
+]
+
+
+def measure(function, repeat: int = 5, min_seconds: float = 0.2) -> dict:
+    """
+    Times a function, calling it enough times per round for the round to last at least `min_seconds`.
+
+    Args:
+        function (Callable[[], Any]): The function to time.
+        repeat (int): The number of rounds.
+        min_seconds (float): The minimum duration of a round, slow functions are called once per round.
+
+    Returns:
+        dict: The median, minimum, mean and maximum time per call in milliseconds, and the number of calls per round.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_seconds or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_seconds / 10 else 2
+
+    times = [elapsed / number] + [
+        t / number for t in timer.repeat(repeat=repeat - 1, number=number)
+    ]
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "mean_ms": statistics.fmean(times) * 1000,
+        "max_ms": max(times) * 1000,
+        "calls_per_round": number,
+        "rounds": repeat,
+    }
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings, so the few-shot prompt renders without any network call.
+    """
+
+    dimensions = 256
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def bench_ingest(csv_folder: str, work_folder: str, repeat: int) -> dict:
+    from src.database.ingest import ingest_tables
+
+    path = os.path.join(work_folder, "ingest_benchmark.db")
+
+    def ingest():
+        connection = sqlite3.connect(path)
+        try:
+            ingest_tables(connection, csv_folder, force=True)
+        finally:
+            connection.close()
+
+    return measure(ingest, repeat=repeat, min_seconds=0)
+
+
+def bench_rewriter(sql, repeat: int) -> dict:
+    return {
+        "rewrite_uncached": measure(
+            lambda: [sql.query_rewriter._rewrite(q) for q in QUERIES], repeat
+        ),
+        "rewrite_cached": measure(
+            lambda: [sql.query_rewriter.rewrite(q) for q in QUERIES], repeat
+        ),
+    }
+
+
+def bench_sql_tool(sql, repeat: int) -> dict:
+    def cold():
+        for query in QUERIES:
+            sql.result_cache.clear()
+            sql.sql_tool(query)
+
+    return {
+        "sql_tool_cold": measure(cold, repeat),
+        "sql_tool_cached": measure(lambda: [sql.sql_tool(q) for q in QUERIES], repeat),
+    }
+
+
+def bench_replace_null_values(sql, repeat: int) -> dict:
+    columns, rows = sql.execute("SELECT * FROM advisors_clients")
+    result = measure(lambda: sql.replace_null_values(columns, rows), repeat)
+    result["rows"] = len(rows)
+    return result
+
+
+def bench_encode_result(sql, repeat: int) -> dict:
+    from src.tools.result_encoder import encode_result
+
+    columns, rows = sql.run_query(
+        'SELECT "Client", "Symbol", "Market Value" FROM advisors_clients',
+        max_rows=sql.SQL_MAX_RESULT_ROWS,
+    )
+    result = measure(
+        lambda: encode_result(columns, rows, token_budget=sql.SQL_RESULT_TOKEN_BUDGET),
+        repeat,
+    )
+    result["rows"] = len(rows)
+    return result
+
+
+def bench_prompts(repeat: int) -> dict:
+    import src.agent as agent
+    import src.prompts.few_shot_queries_prompt as few_shot
+
+    # The examples are embedded offline, the selection itself is the same as in production
+    few_shot.get_example_embeddings = lambda: (HashingEmbeddings(), "hashing")
+    few_shot_prompt = few_shot.get_few_shot_queries_prompt()
+    question = "Which assets Client_1 have a target allocation smaller than 40%?"
+
+    return {
+        "agent_prompt": measure(
+            lambda: agent.prompt.format_messages(
+                input=question, chat_history=[], agent_scratchpad=""
+            ),
+            repeat,
+        ),
+        "few_shot_prompt": measure(
+            lambda: few_shot_prompt.format(input=question), repeat
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[3])
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ingest-repeat", type=int, default=3)
+    parser.add_argument("--log", action="store_true", help="Keep the INFO logs")
+    args = parser.parse_args()
+
+    if not args.log:
+        logging.disable(logging.INFO)
+
+    csv_folder = os.environ["SQL_AGENT_CSV_FOLDER"]
+    results = {"ingest": bench_ingest(csv_folder, csv_folder, args.ingest_repeat)}
+
+    import src.tools.sql as sql
+
+    results.update(bench_rewriter(sql, args.repeat))
+    results.update(bench_sql_tool(sql, args.repeat))
+    results["replace_null_values"] = bench_replace_null_values(sql, args.repeat)
+    results["encode_result"] = bench_encode_result(sql, args.repeat)
+    results.update(bench_prompts(args.repeat))
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Gunicorn Configuration for Multi-Worker Deployment
+--------------------------------------------------
+
+This module configures gunicorn to serve the FastAPI application with one uvicorn worker process per core, so the
+CPU bound parts of a request, e.g. the prompt building, the SQL rewriting and the result encoding, no longer share a
+single core and a single GIL.
+
+State shared by the workers:
+- The database is built once, by the master process before the workers start, and the workers only attach to it.
+  Reloading gunicorn (SIGHUP) ingests the CSV files that changed before the new workers start.
+- The conversation histories are kept in SQLite, so a follow-up question can be served by any worker.
+- The Prometheus metrics of every worker are written to `PROMETHEUS_MULTIPROC_DIR`, and `/metrics` serves their sum.
+- The LLM cache and the few-shot index already live in files, shared by every worker.
+
+Usage
+-----
+    ```sh
+    gunicorn main:app -c gunicorn.conf.py
+    ```
+The number of workers defaults to the number of cores, set `WEB_CONCURRENCY` to change it, and `GUNICORN_BIND` to
+listen on another address.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from prometheus_client import multiprocess
+
+# Read by the master when a worker exits and by the workers, which inherit the environment of the master process
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "agent-metrics")
+)
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Every worker imports the application itself, the thread pools and the SQLite connections do not survive a fork
+preload_app = False
+# Agent runs can take tens of seconds, streamed ones even more
+timeout = 120
+graceful_timeout = 30
+
+
+# Read by the application when a worker imports it, the database is already built by the master
+WORKER_ENV = {"MULTI_PROCESS": "true", "SQL_INGEST_ON_STARTUP": "false"}
+
+
+def build_database():
+    # Importing the SQL tool ingests the CSV files that changed, in a separate process so the master stays light.
+    # Its metrics are left out of the ones of the workers.
+    env = {**os.environ, "SQL_INGEST_ON_STARTUP": "true"}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    subprocess.run([sys.executable, "-c", "import src.tools.sql"], env=env, check=True)
+
+
+def on_starting(server):
+    # Metrics of a previous run would be added to the ones of this run
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    server.log.info("Building the database before starting the workers")
+    build_database()
+
+
+def on_reload(server):
+    server.log.info(
+        "Ingesting the CSV files that changed before restarting the workers"
+    )
+    build_database()
+
+
+def post_fork(server, worker):
+    # Runs in the worker before it imports the application, the environment of the master is left untouched
+    os.environ.update(WORKER_ENV)
+
+
+def child_exit(server, worker):
+    # Keeps the counters of the exited worker, and drops its live values
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,289 @@
+"""
+Module Overview
+---------------
+This module drives load against the API and reports its latency, throughput and error rate.
+The traffic is replayed from a file of payloads: either a JSON lines file with one `{"user_query", "session_id"}`
+object per line, or a shell script of curl commands like `examples.sh`, whose `-d` payloads are extracted. Requests
+are sent open loop at a target rate, i.e. a slow server does not slow the arrivals down, so the offered load stays
+fixed and queueing shows up in the latency. Several rates can be run in a row to find the rate past which the
+throughput stops following the offered load: the concurrency ceiling of the server.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Traffic: Functions to load the payloads.
+- Data Models: The outcome of a single request.
+- Load: Functions to send the requests at a target rate and to summarize their outcomes.
+- Main: The command line interface.
+
+Example usage:
+    # 5 requests per second for 30 seconds against /generate, replaying examples.sh
+    python -m loadtest.driver --url http://127.0.0.1:8000 --traffic examples.sh --rps 5 --duration 30
+
+    # Step the rate up to find the ceiling of a single worker, and save the reports
+    python -m loadtest.driver --rps 1 2 4 8 16 --duration 20 --output loadtest/report.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+
+__all__ = ["load_traffic", "run_load", "summarize"]
+
+CURL_PAYLOAD_PATTERN = re.compile(r"-d\s+'(\{.*?\})'", re.DOTALL)
+
+
+def load_traffic(path: str) -> list[dict]:
+    """
+    Loads the payloads to replay.
+
+    Args:
+        path (str): A JSON lines file of payloads, or a shell script of curl commands with `-d '<json>'` payloads.
+
+    Returns:
+        list[dict]: The payloads, in order.
+    """
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+
+    if path.endswith((".jsonl", ".json")):
+        payloads = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        payloads = [json.loads(match) for match in CURL_PAYLOAD_PATTERN.findall(text)]
+
+    payloads = [p for p in payloads if "user_query" in p]
+    if not payloads:
+        raise ValueError(f"No payload with a user_query found in {path}")
+    return payloads
+
+
+class Outcome(NamedTuple):
+    """
+    The outcome of a single request.
+
+    Attributes:
+        latency (float): Seconds from sending the request to receiving the whole response.
+        first_byte (float): Seconds from sending the request to receiving the first byte of the response.
+        status (int): The HTTP status code, None if no response was received.
+        error (str): The kind of error, None if the request succeeded.
+    """
+
+    latency: float
+    first_byte: Optional[float]
+    status: Optional[int]
+    error: Optional[str]
+
+
+async def send(
+    client: httpx.AsyncClient, endpoint: str, payload: dict, timeout: float
+) -> Outcome:
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        async with client.stream(
+            "POST", endpoint, json=payload, timeout=timeout
+        ) as response:
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                body.extend(chunk)
+            latency = time.perf_counter() - start
+            error = None if response.is_success else f"HTTP {response.status_code}"
+            # The streaming endpoint reports failures as events of a successful response
+            if error is None and b"event: error" in body:
+                error = "stream error event"
+            return Outcome(latency, first_byte, response.status_code, error)
+    except httpx.TimeoutException:
+        return Outcome(time.perf_counter() - start, first_byte, None, "timeout")
+    except httpx.HTTPError as e:
+        return Outcome(time.perf_counter() - start, first_byte, None, type(e).__name__)
+
+
+async def run_load(
+    url: str,
+    endpoint: str,
+    payloads: list[dict],
+    rps: float,
+    duration: float,
+    timeout: float = 60,
+    sessions: Optional[int] = None,
+    poisson: bool = False,
+    seed: Optional[int] = None,
+) -> tuple[list[Outcome], float]:
+    """
+    Sends requests open loop at a target rate.
+
+    Args:
+        url (str): The base URL of the API.
+        endpoint (str): The path of the endpoint, e.g. /generate.
+        payloads (list[dict]): The payloads, replayed in order and cycled.
+        rps (float): The target number of requests per second.
+        duration (float): Seconds during which requests are sent.
+        timeout (float): Seconds after which a request is abandoned.
+        sessions (int): The number of distinct sessions the requests are spread over, None keeps the session IDs
+            of the payloads.
+        poisson (bool): Draw the gaps between requests from an exponential distribution instead of a fixed interval.
+        seed (int): The seed of the Poisson arrivals.
+
+    Returns:
+        tuple[list[Outcome], float]: The outcome of every request and the wall time of the run in seconds.
+    """
+    rng = random.Random(seed)
+    total = max(1, int(rps * duration))
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+        tasks = []
+        start = time.perf_counter()
+        send_at = 0.0
+        for index in range(total):
+            delay = start + send_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            payload = dict(payloads[index % len(payloads)])
+            if sessions:
+                payload["session_id"] = f"loadtest-{index % sessions}"
+            tasks.append(asyncio.create_task(send(client, endpoint, payload, timeout)))
+            send_at += rng.expovariate(rps) if poisson else 1 / rps
+
+        outcomes = await asyncio.gather(*tasks)
+        return list(outcomes), time.perf_counter() - start
+
+
+def percentile(values: list[float], percent: float) -> Optional[float]:
+    # Nearest rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(outcomes: list[Outcome], wall_time: float, rps: float) -> dict:
+    """
+    Summarizes the outcomes of a run.
+
+    Args:
+        outcomes (list[Outcome]): The outcome of every request.
+        wall_time (float): The wall time of the run in seconds.
+        rps (float): The target number of requests per second.
+
+    Returns:
+        dict: The counts, the rates, the latency percentiles of the successful requests in milliseconds and the
+            count of each kind of error.
+    """
+    succeeded = [o for o in outcomes if o.error is None]
+    latencies = [o.latency * 1000 for o in succeeded]
+    first_bytes = [o.first_byte * 1000 for o in succeeded if o.first_byte is not None]
+    errors = {}
+    for outcome in outcomes:
+        if outcome.error is not None:
+            errors[outcome.error] = errors.get(outcome.error, 0) + 1
+
+    return {
+        "target_rps": rps,
+        "requests": len(outcomes),
+        "succeeded": len(succeeded),
+        "error_rate": 1 - len(succeeded) / len(outcomes) if outcomes else 0.0,
+        "errors": errors,
+        "wall_time_s": wall_time,
+        "throughput_rps": len(succeeded) / wall_time if wall_time else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies, default=None),
+        },
+        "first_byte_ms": {
+            "p50": percentile(first_bytes, 50),
+            "p95": percentile(first_bytes, 95),
+            "p99": percentile(first_bytes, 99),
+        },
+    }
+
+
+def format_report(reports: list[dict]) -> str:
+    def ms(value):
+        return f"{value:>9.0f}" if value is not None else f"{'-':>9}"
+
+    lines = [
+        f"{'target rps':>10} {'requests':>9} {'ok rps':>8} {'errors':>7} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb p50':>9}"
+    ]
+    for report in reports:
+        latency = report["latency_ms"]
+        lines.append(
+            f"{report['target_rps']:>10g} {report['requests']:>9} {report['throughput_rps']:>8.2f} "
+            f"{report['error_rate']:>7.1%} {ms(latency['p50'])} {ms(latency['p95'])} {ms(latency['p99'])} "
+            f"{ms(report['first_byte_ms']['p50'])}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives load against the API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--endpoint",
+        default="/generate",
+        choices=["/generate", "/generate/stream"],
+    )
+    parser.add_argument("--traffic", default="examples.sh")
+    parser.add_argument(
+        "--rps",
+        type=float,
+        nargs="+",
+        default=[1.0],
+        help="Target rates, run one after the other",
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per rate")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        help="Spread the requests over this many sessions instead of the payload session IDs",
+    )
+    parser.add_argument("--poisson", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="JSON file the reports are written to")
+    args = parser.parse_args()
+
+    payloads = load_traffic(args.traffic)
+    reports = []
+    for rps in args.rps:
+        print(
+            f"Sending {rps:g} requests per second for {args.duration:g}s to {args.url}{args.endpoint}",
+            file=sys.stderr,
+        )
+        outcomes, wall_time = asyncio.run(
+            run_load(
+                args.url,
+                args.endpoint,
+                payloads,
+                rps,
+                args.duration,
+                timeout=args.timeout,
+                sessions=args.sessions,
+                poisson=args.poisson,
+                seed=args.seed,
+            )
+        )
+        reports.append(summarize(outcomes, wall_time, rps))
+
+    print(format_report(reports))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Module Overview
+---------------
+This module provides a local stand-in for the OpenAI API, to load test the application without spending API credits or
+hitting rate limits.
+It implements the chat completions endpoint, streamed or not, and the embeddings endpoint. The chat completions follow
+the shape of a ReAct run of the agent: while the conversation has no tool result after the last user message, the
+model calls the SQL tool with a query picked from a script by matching the user message; once the tool answered, the
+model returns a final answer quoting the tool result. Every response waits for a configurable latency, and a share of
+the requests can be failed on purpose to exercise the error paths.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Script: The default questions to SQL queries script.
+- Helpers: Functions to pick the scripted query and build the completions.
+- App Factory: A function creating the FastAPI app of the mock server.
+- Main: The command line interface.
+
+Example usage:
+    # Start the mock server with 300 ms +/- 100 ms per completion
+    python -m loadtest.mock_openai --port 8001 --latency-ms 300 --jitter-ms 100
+
+    # Point the application at it
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock LLM_CACHE=off fastapi run main.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+__all__ = ["create_app"]
+
+DEFAULT_SCRIPT = [
+    (
+        r"tesla|tsla",
+        'SELECT DISTINCT "Client" FROM advisors_clients WHERE "Symbol" = \'TSLA\';',
+    ),
+    (
+        r"(client[ _]?\d+).*smaller|smaller.*(client[ _]?\d+)",
+        'SELECT "Asset Class", "Target Allocation (%)" FROM allocations WHERE "Client" = \'Client_1\' AND "Target Allocation (%)" < 40;',
+    ),
+    (
+        r"bonds?",
+        'SELECT "Client" FROM allocations WHERE "Asset Class" = \'Bonds\' AND "Target Allocation (%)" > 20;',
+    ),
+    (
+        r"portfolio",
+        'SELECT "Client", "Target Portfolio" FROM allocations LIMIT 10;',
+    ),
+    (
+        r"market value|holdings?",
+        'SELECT "Client", SUM("Market Value") FROM advisors_clients GROUP BY "Client" ORDER BY 2 DESC LIMIT 5;',
+    ),
+    (
+        r".*",
+        'SELECT "Client", "Target Allocation (%)" FROM allocations WHERE "Asset Class" = \'Stocks\' LIMIT 5;',
+    ),
+]
+
+
+SCRATCHPAD_TOOL_MESSAGE = re.compile(
+    r"ToolMessage\(content=(['\"])(.*?)\1, ", re.DOTALL
+)
+
+
+def scripted_query(question: str, script: list[tuple[str, str]]) -> str:
+    for pattern, query in script:
+        if re.search(pattern, question, re.IGNORECASE):
+            return query
+    return script[-1][1]
+
+
+def tool_result(messages: list[dict]) -> Optional[str]:
+    """
+    Returns what the tools answered since the last user message, None if no tool was called yet.
+    The agent prompt renders its scratchpad, a list of tool calls and tool messages, as the text of an assistant
+    message, the tool messages are read from that text. Real tool messages are also accepted.
+    """
+    for message in reversed(messages):
+        role = message.get("role")
+        if role == "user":
+            return None
+        if role == "tool":
+            return message_text(message)
+        if role == "assistant":
+            results = SCRATCHPAD_TOOL_MESSAGE.findall(message_text(message))
+            if results:
+                return results[-1][1]
+    return None
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return content
+
+
+def last_user_message(messages: list[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message_text(message)
+    return ""
+
+
+def count_tokens(text: str) -> int:
+    # Rough estimate, the mock does not need the real tokenizer
+    return max(1, len(text) // 4)
+
+
+def complete(body: dict, script: list[tuple[str, str]]) -> tuple[Optional[dict], str]:
+    """
+    Builds the scripted reply to a chat completion request.
+
+    Args:
+        body (dict): The chat completion request.
+        script (list[tuple[str, str]]): The patterns matched against the user message and their SQL queries.
+
+    Returns:
+        tuple[Optional[dict], str]: The tool call, None for a final answer, and the content of the reply.
+    """
+    messages = body.get("messages", [])
+    tools = body.get("tools") or []
+    result = tool_result(messages)
+    if tools and result is None:
+        name = tools[0].get("function", {}).get("name", "sql_tool")
+        query = scripted_query(last_user_message(messages), script)
+        tool_call = {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps({"query": query})},
+        }
+        return tool_call, ""
+
+    if result:
+        return None, f"According to the database: {result[:300]}"
+    return None, "I can only answer questions about the clients of the advisor."
+
+
+def usage(body: dict, content: str) -> dict:
+    prompt_tokens = sum(
+        count_tokens(json.dumps(message)) for message in body.get("messages", [])
+    )
+    completion_tokens = count_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def create_app(
+    latency_ms: float = 300,
+    jitter_ms: float = 0,
+    error_rate: float = 0,
+    script: Optional[list[tuple[str, str]]] = None,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """
+    Creates the mock OpenAI server.
+
+    Args:
+        latency_ms (float): The mean latency of a completion in milliseconds.
+        jitter_ms (float): The maximum deviation from the mean latency, drawn uniformly.
+        error_rate (float): The share of completions failed with a 500 or a 429 error.
+        script (list[tuple[str, str]]): The patterns matched against the user message and their SQL queries, in
+            order, the last one being the fallback.
+        seed (int): The seed of the latency and error draws.
+
+    Returns:
+        FastAPI: The app of the mock server.
+    """
+    app = FastAPI()
+    script = script or DEFAULT_SCRIPT
+    rng = random.Random(seed)
+    stats = {"chat_completions": 0, "embeddings": 0, "errors": 0}
+
+    async def wait():
+        delay = latency_ms + rng.uniform(-jitter_ms, jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+    def injected_error() -> Optional[JSONResponse]:
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            status = rng.choice([429, 500])
+            return JSONResponse(
+                {"error": {"message": "Injected by the mock server", "type": "mock"}},
+                status_code=status,
+            )
+        return None
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["chat_completions"] += 1
+        await wait()
+        error = injected_error()
+        if error is not None:
+            return error
+
+        tool_call, content = complete(body, script)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+        finish_reason = "tool_calls" if tool_call else "stop"
+
+        if body.get("stream"):
+            # The usage is sent in a last chunk only when the client asks for it, like the OpenAI API does
+            stream_usage = None
+            if (body.get("stream_options") or {}).get("include_usage"):
+                stream_usage = usage(body, content or json.dumps(tool_call))
+            return StreamingResponse(
+                stream_chunks(
+                    completion_id,
+                    created,
+                    model,
+                    tool_call,
+                    content,
+                    finish_reason,
+                    stream_usage,
+                ),
+                media_type="text/event-stream",
+            )
+
+        message = {"role": "assistant", "content": content or None}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+            "usage": usage(body, content or json.dumps(tool_call)),
+        }
+
+    @app.post("/v1/embeddings")
+    @app.post("/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        await wait()
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": index, "embedding": embed(text)}
+                for index, text in enumerate(inputs)
+            ],
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    return app
+
+
+def embed(text, dimensions: int = 256) -> list[float]:
+    # Token ids are sent instead of text when the client tokenizes, they are hashed the same way
+    words = text.lower().split() if isinstance(text, str) else [str(t) for t in text]
+    vector = [0.0] * dimensions
+    for word in words:
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0
+    return vector
+
+
+async def stream_chunks(
+    completion_id: str,
+    created: int,
+    model: str,
+    tool_call: Optional[dict],
+    content: str,
+    finish_reason: str,
+    stream_usage: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    def chunk(delta: dict, finish: Optional[str] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    if tool_call:
+        yield chunk(
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "index": 0,
+                        "id": tool_call["id"],
+                        "type": "function",
+                        "function": {
+                            "name": tool_call["function"]["name"],
+                            "arguments": "",
+                        },
+                    }
+                ],
+            }
+        )
+        yield chunk(
+            {
+                "tool_calls": [
+                    {
+                        "index": 0,
+                        "function": {"arguments": tool_call["function"]["arguments"]},
+                    }
+                ]
+            }
+        )
+    else:
+        yield chunk({"role": "assistant", "content": ""})
+        for word in re.findall(r"\S+\s*", content):
+            yield chunk({"content": word})
+    yield chunk({}, finish_reason)
+    if stream_usage is not None:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [],
+            "usage": stream_usage,
+        }
+        yield f"data: {json.dumps(payload)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the mock OpenAI server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument(
+        "--script",
+        help="JSON file with a list of [pattern, query] pairs replacing the default script",
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as file:
+            script = [tuple(entry) for entry in json.load(file)]
+
+    import uvicorn
+
+    uvicorn.run(
+        create_app(args.latency_ms, args.jitter_ms, args.error_rate, script, args.seed),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,10 @@ Structure
 ---------
 - Imports: Necessary libraries and modules.
 - Data Models: Pydantic models for request validation.
-- FastAPI App: Initialization of the FastAPI application.
-- Endpoints: API endpoints for health check and generating responses.
+- FastAPI App: Initialization of the FastAPI application and of the per worker concurrency limit.
+- Helpers: Functions to run the agent and to format Server-Sent Events.
+- Middleware: The per-request trace feeding the Prometheus metrics, and the request ID of the logs.
+- Endpoints: API endpoints for health check, metrics and generating responses, either at once or streamed.
 
 Usage
 -----
@@ -21,26 +23,96 @@ Usage
     ```
 2. Access the health check endpoint at:
     http://127.0.0.1:8000/healthcheck
+   and the hit rates of the fast path and of the SQL result cache at:
+    http://127.0.0.1:8000/stats
+   and the Prometheus metrics at:
+    http://127.0.0.1:8000/metrics
 3. Generate a response by sending a POST request to:
     http://127.0.0.1:8000/generate
     with a JSON payload containing the user query.
+4. Stream the generated SQL, the tool results and the answer tokens as Server-Sent Events by sending the same
+   payload to:
+    http://127.0.0.1:8000/generate/stream
+5. Generate responses for many queries in a single round trip by sending a POST request to:
+    http://127.0.0.1:8000/generate/batch
+    with a JSON payload containing a list of items, each with a user query and a session ID.
 
 Example:
     ```sh
     curl -X POST http://0.0.0.0:8000/generate -H "Content-Type: application/json" -d '{"user_query": "Which assets Client_1 have a target allocation smaller than 40%?", "session_id": "123"}'
+    curl -N -X POST http://0.0.0.0:8000/generate/stream -H "Content-Type: application/json" -d '{"user_query": "Which assets Client_1 have a target allocation smaller than 40%?", "session_id": "123"}'
     ```
 
+Fast Path
+---------
+Questions matching a known shape, e.g. "What is the target portfolio of Client_1?", are answered from a single SQL
+query without calling the LLM. Every other question goes to the agent. Set `FAST_PATH_ENABLED=false` to always run
+the agent.
+
+Concurrency
+-----------
+Agent runs are executed asynchronously, so a slow request never blocks the health check or other users.
+The number of agent runs in flight per worker is capped by the `AGENT_MAX_CONCURRENCY` environment variable.
+
+Metrics
+-------
+Every request is traced: the durations of its stages (history lookup, fast path, prompt building, LLM calls, tool
+calls, SQL rewriting and execution, null value replacement), its token counts, agent iterations and tool calls are
+exported as Prometheus metrics at `/metrics`. Set `METRICS_SERVER_TIMING=true` to also return the stage durations of
+each request in a `Server-Timing` header.
+
+Deployment
+----------
+To use every core, run several worker processes with the gunicorn configuration of the repository:
+    ```sh
+    gunicorn main:app -c gunicorn.conf.py
+    ```
+It builds the database once before the workers start, shares the conversation histories between the workers through
+SQLite, and aggregates the Prometheus metrics of every worker at `/metrics`. The counters of `/stats` are per worker.
+
+Logging
+-------
+Logs are written by a background thread, a request only enqueues its records. The console gets text lines and the
+log file JSON lines, rotated by size, both tagged with the request ID and the session ID. The steps of the agent are
+logged for the share of the requests set by `AGENT_TRACE_SAMPLE_RATE`.
+
 Dependencies
 ------------
 - fastapi: The web framework for building APIs with Python.
 - pydantic: Data validation and settings management using Python type annotations.
+- prometheus_client: Exposition of the metrics in the Prometheus format.
 
 """
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+from pydantic import BaseModel, Field
 
-from src.agent import agent
+from src.agent import agent, agent_executor, answer_from_fast_path, fast_path
+from src.config import (
+    BATCH_ITEM_TIMEOUT_SECONDS,
+    BATCH_MAX_CONCURRENCY,
+    BATCH_MAX_ITEMS,
+    MAX_CONCURRENT_GENERATIONS,
+    METRICS_SERVER_TIMING,
+)
+from src.logger.agent_trace import sample_agent_trace
+from src.logger.logger import bind_log_context
+from src.metrics import RequestTrace, finish_trace, start_trace
+from src.tools.sql import result_cache
 
 
 class GenerationRequest(BaseModel):
@@ -56,7 +128,119 @@ class GenerationRequest(BaseModel):
     session_id: str
 
 
+class BatchGenerationRequest(BaseModel):
+    """
+    Data model for the batch generation request payload.
+
+    Attributes:
+        items (list[GenerationRequest]): The queries to be processed by the agent.
+        timeout_seconds (float): Seconds after which a single item is abandoned, defaults to `BATCH_ITEM_TIMEOUT_SECONDS`.
+    """
+
+    items: list[GenerationRequest] = Field(max_length=BATCH_MAX_ITEMS)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)
+
+
+class BatchGenerationResult(BaseModel):
+    """
+    Data model for the result of a single item of a batch.
+
+    Attributes:
+        output (str): The response generated by the agent, None if the item failed.
+        error (str): The reason the item failed, None if it succeeded.
+    """
+
+    output: Optional[str] = None
+    error: Optional[str] = None
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Formats a Server-Sent Event.
+
+    Args:
+        event (str): The name of the event.
+        data (Any): The JSON serializable payload of the event.
+
+    Returns:
+        str: The event in the text/event-stream wire format.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 app = FastAPI()
+generation_slots = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+
+
+async def run_agent(gen_req: GenerationRequest) -> str:
+    """
+    Runs the agent on the user's query once a generation slot is free.
+    Known question shapes are answered by the fast path without waiting for a slot.
+
+    Args:
+        gen_req (GenerationRequest): The request payload containing the user's query.
+
+    Returns:
+        str: The response generated by the agent.
+    """
+    bind_log_context(session_id=gen_req.session_id)
+    answer = await asyncio.to_thread(
+        answer_from_fast_path, gen_req.user_query, gen_req.session_id
+    )
+    if answer is not None:
+        return answer
+
+    async with generation_slots:
+        response = await agent.ainvoke(
+            {
+                "input": gen_req.user_query,
+            },
+            {"configurable": {"session_id": gen_req.session_id}},
+        )
+    return response["output"]
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Traces every request, the endpoint runs in a copy of the context holding the trace and the log context.
+    The metrics are recorded once the body is sent, so streamed responses are timed until their last event, while
+    the Server-Timing header only holds the stages done before the first byte.
+    The request ID is taken from the X-Request-ID header when the client sends one, and returned in the response.
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    bind_log_context(request_id=request_id)
+    sample_agent_trace()
+    trace = start_trace()
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish_trace(trace, route_path(request), 500)
+        raise
+
+    response.headers["X-Request-ID"] = request_id
+    if METRICS_SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    response.body_iterator = finish_after_body(
+        response.body_iterator, trace, route_path(request), response.status_code
+    )
+    return response
+
+
+def route_path(request: Request) -> str:
+    # The path template of the route rather than the URL, so unknown paths do not create new label values
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+async def finish_after_body(
+    body: AsyncIterator[bytes], trace: RequestTrace, endpoint: str, status: int
+) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        finish_trace(trace, endpoint, status)
 
 
 @app.get("/healthcheck")
@@ -70,6 +254,40 @@ async def healthcheck():
     return {"status": "ok"}
 
 
+@app.get("/stats")
+async def stats():
+    """
+    Endpoint exposing the hit rates of the fast path and of the SQL result cache, of the worker serving the request.
+
+    Returns:
+        dict: The counters of the fast path, None if it is disabled, and of the SQL result cache.
+    """
+    return {
+        "fast_path": fast_path.stats() if fast_path is not None else None,
+        "sql_cache": result_cache.stats(),
+    }
+
+
+# Under gunicorn, every worker writes its metrics to PROMETHEUS_MULTIPROC_DIR and any of them serves the sum
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    metrics_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(metrics_registry)
+else:
+    metrics_registry = REGISTRY
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Endpoint exposing the Prometheus metrics: request and stage durations, token counts, agent iterations and tool
+    calls. With several worker processes, the metrics of every worker are aggregated.
+
+    Returns:
+        Response: The metrics in the Prometheus text format.
+    """
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/generate")
 async def generate(gen_req: GenerationRequest):
     """
@@ -81,10 +299,108 @@ async def generate(gen_req: GenerationRequest):
     Returns:
         dict: The response generated by the agent.
     """
-    response = agent.invoke(
-        {
-            "input": gen_req.user_query,
-        },
-        {"configurable": {"session_id": gen_req.session_id}},
+    return await run_agent(gen_req)
+
+
+async def stream_agent_events(gen_req: GenerationRequest) -> AsyncIterator[str]:
+    """
+    Runs the agent and yields its progress as Server-Sent Events.
+
+    The following events are emitted, in the order they are produced:
+    - sql: The SQL query the agent is about to run.
+    - tool_result: The result returned by the SQL tool.
+    - token: A token of the answer generated by the LLM.
+    - output: The final answer of the agent.
+    - error: The agent failed, the stream ends after this event.
+
+    A query answered by the fast path only emits the output event.
+
+    Args:
+        gen_req (GenerationRequest): The request payload containing the user's query.
+
+    Yields:
+        str: The events in the text/event-stream wire format.
+    """
+    bind_log_context(session_id=gen_req.session_id)
+    try:
+        answer = await asyncio.to_thread(
+            answer_from_fast_path, gen_req.user_query, gen_req.session_id
+        )
+    except Exception as e:
+        yield format_sse("error", str(e))
+        return
+    if answer is not None:
+        yield format_sse("output", answer)
+        return
+
+    async with generation_slots:
+        try:
+            async for event in agent.astream_events(
+                {
+                    "input": gen_req.user_query,
+                },
+                {"configurable": {"session_id": gen_req.session_id}},
+                version="v2",
+            ):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    token = event["data"]["chunk"].content
+                    if token:
+                        yield format_sse("token", token)
+                elif kind == "on_tool_start":
+                    yield format_sse("sql", event["data"].get("input"))
+                elif kind == "on_tool_end":
+                    yield format_sse("tool_result", event["data"].get("output"))
+                elif (
+                    kind == "on_chain_end"
+                    and event["name"] == agent_executor.get_name()
+                ):
+                    yield format_sse("output", event["data"]["output"]["output"])
+        except Exception as e:
+            yield format_sse("error", str(e))
+
+
+@app.post("/generate/stream")
+async def generate_stream(gen_req: GenerationRequest):
+    """
+    Endpoint to stream the agent's progress as Server-Sent Events while it answers the user's query.
+
+    Args:
+        gen_req (GenerationRequest): The request payload containing the user's query.
+
+    Returns:
+        StreamingResponse: The generated SQL, the tool results and the answer tokens as they are produced.
+    """
+    return StreamingResponse(
+        stream_agent_events(gen_req), media_type="text/event-stream"
     )
-    return response["output"]
+
+
+@app.post("/generate/batch")
+async def generate_batch(batch_req: BatchGenerationRequest):
+    """
+    Endpoint to generate responses from the agent for a batch of queries.
+
+    The items are processed concurrently, at most `BATCH_MAX_CONCURRENCY` at a time, and each item is abandoned
+    after its timeout. A failed item does not fail the batch, its error is reported in its result instead.
+
+    Args:
+        batch_req (BatchGenerationRequest): The request payload containing the user's queries.
+
+    Returns:
+        list[BatchGenerationResult]: The result of each item, in the same order as the items.
+    """
+    batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    timeout = batch_req.timeout_seconds or BATCH_ITEM_TIMEOUT_SECONDS
+
+    async def run_item(item: GenerationRequest) -> BatchGenerationResult:
+        async with batch_slots:
+            try:
+                output = await asyncio.wait_for(run_agent(item), timeout)
+            except asyncio.TimeoutError:
+                return BatchGenerationResult(error=f"Timed out after {timeout}s")
+            except Exception as e:
+                return BatchGenerationResult(error=str(e))
+        return BatchGenerationResult(output=output)
+
+    return await asyncio.gather(*[run_item(item) for item in batch_req.items])
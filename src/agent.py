@@ -2,26 +2,35 @@
 Module Overview
 ---------------
 This module is designed to create and configure a ReAct (Reasoning and Acting) agent using LangChain and OpenAI's GPT-3.5-turbo model.
-The agent is integrated with a set of tools, such as an SQL tool, and utilizes a memory buffer to maintain conversation history across sessions.
+The agent is integrated with a set of tools, such as an SQL tool, and utilizes a bounded memory buffer per session to maintain conversation history.
 
 Structure
 ---------
 - Imports: Necessary libraries and modules.
 - Functions: Functions to handle session history retrieval.
-- LLM Initialization: Setting up the language model with tools.
-- Prompt Construction: Building the prompt template.
+- LLM Initialization: Setting up the language model with tools and its response cache.
+- Prompt Construction: Building the prompt template, with the schema compiled from the live tables.
 - Agent and Memory Setup: Creating the agent and memory components.
+- Fast Path: Answering the known question shapes without the agent.
 
 Example Usage:
     from src.agent import agent
 
     # Running the agent with user input
     response = agent.run({"session_id": "session_id_123", "input": "What is the target allocation percentage of stocks for each client?"})
+
+    # Running the agent from async code, the LLM calls and the SQL tool do not block the event loop
+    response = await agent.ainvoke({"input": "What is the target allocation percentage of stocks for each client?"}, {"configurable": {"session_id": "session_id_123"}})
+
+    # Answering a known question shape without the LLM, None if the agent must run
+    answer = answer_from_fast_path("What is the target portfolio of Client_1?", "session_id_123")
 """
 
+from typing import Optional
+
 from langchain.agents import create_openai_tools_agent
-from langchain.agents.agent import AgentExecutor
-from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain.agents.agent import RunnableMultiActionAgent
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import (
     ChatPromptTemplate,
     PromptTemplate,
@@ -29,11 +38,66 @@ from langchain_core.prompts import (
 )
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.tools import StructuredTool
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 import src.prompts as p
+from src.cache import LRUCachedEmbeddings, SQLiteLLMCache
+from src.config import (
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    FAST_PATH_ENABLED,
+    HISTORY_BACKEND,
+    HISTORY_DB_PATH,
+    HISTORY_FLUSH_INTERVAL_SECONDS,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_MAX_SESSIONS,
+    HISTORY_SESSION_TTL_SECONDS,
+    LLM_CACHE,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_SIMILARITY_THRESHOLD,
+    LLM_CACHE_TTL_SECONDS,
+    MULTI_PROCESS,
+    PROMPT_MAX_DISTINCT_VALUES,
+    PROMPT_SCHEMA_TOKEN_BUDGET,
+)
+from src.logger.agent_trace import AgentTraceCallbackHandler
 from src.logger.logger import l
-from src.tools.sql import sql_tool
+from src.memory import (
+    SessionHistoryRegistry,
+    SQLiteChatMessageHistory,
+    SQLiteHistoryStore,
+)
+from src.metrics import MetricsCallbackHandler, span
+from src.router import FastPathRouter, get_intents
+from src.tools.executor import ParallelAgentExecutor
+from src.tools.sql import (
+    async_sql_tool,
+    execute,
+    get_categorical_values,
+    get_tables_columns,
+    run_query,
+    sql_tool,
+)
+
+l.info(f"Building LLM cache with tiers: {LLM_CACHE}")
+llm_cache = None
+if LLM_CACHE in ("exact", "semantic"):
+    llm_cache = SQLiteLLMCache(
+        LLM_CACHE_PATH,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds=LLM_CACHE_TTL_SECONDS,
+        # The lookup and the update of a miss embed the same question, it is computed once
+        embeddings=(
+            LRUCachedEmbeddings(
+                OpenAIEmbeddings(model="text-embedding-ada-002"),
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+            )
+            if LLM_CACHE == "semantic"
+            else None
+        ),
+        similarity_threshold=LLM_CACHE_SIMILARITY_THRESHOLD,
+        categorical_values=get_categorical_values,
+    )
 
 l.info("Building LLM")
 llm = ChatOpenAI(
@@ -42,14 +106,27 @@ llm = ChatOpenAI(
     model_kwargs={
         "seed": 42,
     },
+    cache=llm_cache or False,
+    # Reports the token usage of streamed calls too, for the metrics
+    stream_usage=True,
 )
 
 l.info("Binding tools to the LLM")
-tools = [StructuredTool.from_function(func=sql_tool, handle_tool_error=True)]
+tools = [
+    StructuredTool.from_function(
+        func=sql_tool, coroutine=async_sql_tool, handle_tool_error=True
+    )
+]
 llm.bind_tools(tools)
 
 
 l.info("Building prompts")
+schema_prompt = p.SchemaPromptCompiler(
+    execute,
+    get_tables_columns,
+    token_budget=PROMPT_SCHEMA_TOKEN_BUDGET,
+    max_distinct_values=PROMPT_MAX_DISTINCT_VALUES,
+)
 system_prompt = PromptTemplate.from_template(
     "".join(
         [
@@ -57,7 +134,9 @@ system_prompt = PromptTemplate.from_template(
             p.get_tools_prompt(tools),
             p.get_sql_tool_rules_prompt(),
         ]
-    )
+    ),
+    # Rendered on every call, recompiled only when the schema changed
+    partial_variables={"schema": schema_prompt.render},
 )
 
 prompt = ChatPromptTemplate.from_messages(
@@ -69,27 +148,93 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-l.info("Initializing agent memory")
+l.info(f"Initializing agent memory with the {HISTORY_BACKEND} backend")
+
+history_factory = None
+if HISTORY_BACKEND == "sqlite":
+    history_store = SQLiteHistoryStore(
+        HISTORY_DB_PATH, flush_interval=HISTORY_FLUSH_INTERVAL_SECONDS
+    )
+    history_factory = lambda session_id: SQLiteChatMessageHistory(  # noqa: E731
+        history_store, session_id, HISTORY_MAX_MESSAGES, shared=MULTI_PROCESS
+    )
+elif MULTI_PROCESS:
+    l.warning(
+        "Histories are kept in memory by each worker process, a follow-up question served by another worker loses "
+        "its context. Set HISTORY_BACKEND=sqlite to share them."
+    )
 
-memory = ChatMessageHistory(session_id="test-session")
+memory = SessionHistoryRegistry(
+    max_sessions=HISTORY_MAX_SESSIONS,
+    ttl_seconds=HISTORY_SESSION_TTL_SECONDS,
+    max_messages=HISTORY_MAX_MESSAGES,
+    history_factory=history_factory,
+)
 
 l.info("Creating ReAct agent")
-react_agent = create_openai_tools_agent(llm=llm, prompt=prompt, tools=tools)
-agent_executor = AgentExecutor(
+react_agent = RunnableMultiActionAgent(
+    runnable=create_openai_tools_agent(llm=llm, prompt=prompt, tools=tools),
+    # LangChain skips the cache when streaming the model, tokens are still streamed to astream_events on cache misses
+    stream_runnable=llm_cache is None,
+)
+# Runs the tool calls of a step in parallel, e.g. one query per table
+agent_executor = ParallelAgentExecutor(
     agent=react_agent,
     tools=tools,
     max_iterations=3,
-    verbose=True,
+    # The steps are logged by AgentTraceCallbackHandler for a sample of the requests instead
+    verbose=False,
     handle_parsing_errors=True,
     return_intermediate_steps=True,
 )
 
+
+def get_session_history(session_id: str):
+    """
+    Returns the history of a session, recording the lookup as a span of the current request.
+
+    Args:
+        session_id (str): The session ID for the conversation.
+
+    Returns:
+        BaseChatMessageHistory: The history of the session.
+    """
+    with span("history"):
+        return memory.get(session_id)
+
+
 agent = RunnableWithMessageHistory(
     agent_executor,
-    # This is needed because in most real world scenarios, a session id is needed
-    # It isn't really used here because we are using a simple in memory ChatMessageHistory
-    lambda session_id: memory,
+    get_session_history,
     input_messages_key="input",
     history_messages_key="chat_history",
-)
+).with_config(callbacks=[MetricsCallbackHandler(), AgentTraceCallbackHandler()])
+
+fast_path = FastPathRouter(get_intents(), run_query) if FAST_PATH_ENABLED else None
+
+
+def answer_from_fast_path(user_query: str, session_id: str) -> Optional[str]:
+    """
+    Answers the user's query without the agent if it matches a known question shape.
+    The question and its answer are added to the session history, so follow-up questions keep their context.
+
+    Args:
+        user_query (str): The user's query.
+        session_id (str): The session ID for the conversation.
+
+    Returns:
+        Optional[str]: The answer, None if the agent must run.
+    """
+    if fast_path is None:
+        return None
+
+    with span("fast_path"):
+        answer = fast_path.route(user_query)
+    if answer is not None:
+        get_session_history(session_id).add_messages(
+            [HumanMessage(content=user_query), AIMessage(content=answer)]
+        )
+    return answer
+
+
 l.info("Agent ready and waiting for input")
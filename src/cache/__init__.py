@@ -0,0 +1,4 @@
+# src/cache/__init__.py
+
+from .embeddings import LRUCachedEmbeddings  # noqa: F401
+from .llm_cache import SQLiteLLMCache  # noqa: F401
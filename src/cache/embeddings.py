@@ -0,0 +1,62 @@
+"""
+Module Overview
+---------------
+This module provides an in-memory LRU cache in front of an embedding model.
+The same questions come back again and again, e.g. a user retrying or the fast path falling back, so the embedding of
+a query is computed once and then served from memory instead of paying a network round trip or a local model forward
+pass every time.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Classes: The cached embeddings wrapper, implementing LangChain's `Embeddings`.
+
+Example usage:
+    from langchain_openai import OpenAIEmbeddings
+
+    from src.cache.embeddings import LRUCachedEmbeddings
+
+    embeddings = LRUCachedEmbeddings(OpenAIEmbeddings(model="text-embedding-ada-002"), max_entries=1024)
+
+    vector = embeddings.embed_query("Which clients hold TSLA?")  # Computed
+    vector = embeddings.embed_query("Which clients hold TSLA?")  # Served from memory
+"""
+
+from functools import lru_cache
+
+from langchain_core.embeddings import Embeddings
+
+__all__ = ["LRUCachedEmbeddings"]
+
+
+class LRUCachedEmbeddings(Embeddings):
+    """
+    Embeddings caching the query embeddings of the wrapped model, the least recently used ones are evicted first.
+
+    Attributes:
+        embeddings (Embeddings): The wrapped embedding model.
+        max_entries (int): The maximum number of cached query embeddings.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 1024):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        # Tuples are cached so callers can not mutate a cached vector
+        self._embed_query = lru_cache(maxsize=max_entries)(
+            lambda text: tuple(self.embeddings.embed_query(text))
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return list(self._embed_query(text))
+
+    def stats(self) -> dict:
+        info = self._embed_query.cache_info()
+        return {
+            "entries": info.currsize,
+            "max_entries": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+        }
@@ -0,0 +1,339 @@
+"""
+Module Overview
+---------------
+This module provides the LLM response cache placed in front of ChatOpenAI.
+The model runs with `temperature=0` and a fixed seed, so a prompt that was already answered can be served from a local
+SQLite file instead of paying the full model latency and cost again. The cache has two tiers:
+- Exact: keyed on the rendered messages and the model parameters, which include the bound tools.
+- Semantic (optional): for a near-duplicate question asked in the same context, i.e. the same system prompt, history
+  and scratchpad, the completion of the most similar cached question is reused when its embedding is close enough.
+  Questions differing only in an entity embed almost identically, e.g. the same question about Client_1 and Client_2,
+  or about stocks and bonds, so the entities of the question are part of the context and must match exactly: the
+  client IDs, numbers, ticker symbols, the words of the categorical values of the tables and the comparisons.
+Entries expire after a time to live and the least recently used entries are evicted past a maximum number of entries.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: Functions to hash keys and extract the entities of a question.
+- Classes: The SQLite backed LLM cache, implementing LangChain's `BaseCache`.
+
+Example usage:
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+    from src.cache.embeddings import LRUCachedEmbeddings
+    from src.cache.llm_cache import SQLiteLLMCache
+
+    # Exact matches only
+    llm = ChatOpenAI(cache=SQLiteLLMCache("data/llm_cache.db"))
+
+    # Exact and semantic matches, the lookup and the update of a miss embed the question once
+    embeddings = LRUCachedEmbeddings(OpenAIEmbeddings())
+    llm = ChatOpenAI(cache=SQLiteLLMCache("data/llm_cache.db", embeddings=embeddings))
+
+Note:
+    LangChain only consults the cache when the model is invoked, not when it is streamed, so the agent must not
+    stream the model when the cache is enabled (see `src/agent.py`).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from src.logger.logger import l
+
+__all__ = ["SQLiteLLMCache"]
+
+
+CLIENT_ID = re.compile(r"client[ _]?(\d+)", re.IGNORECASE)
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+SYMBOL = re.compile(r"\b[A-Z][A-Z.&]{1,5}\b")
+OPERATOR = re.compile(r"[<>!]=?|=")
+WORD = re.compile(r"[^\W\d_][\w&]*")
+
+# Words flipping the meaning of a filter, mapped to the operator they stand for
+COMPARISON_WORDS = {
+    **dict.fromkeys(
+        ("less", "smaller", "lower", "below", "under", "fewer", "beneath"), "<"
+    ),
+    **dict.fromkeys(
+        ("more", "greater", "larger", "higher", "above", "over", "exceeding"), ">"
+    ),
+    **dict.fromkeys(("least", "minimum", "min", "lowest", "smallest"), "min"),
+    **dict.fromkeys(("most", "maximum", "max", "highest", "largest", "top"), "max"),
+    **dict.fromkeys(("not", "no", "without", "except", "excluding"), "not"),
+    **dict.fromkeys(("equal", "equals", "exactly"), "="),
+    **dict.fromkeys(("average", "mean"), "avg"),
+    **dict.fromkeys(("total", "sum"), "sum"),
+}
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_word(word: str) -> str:
+    # Plurals share the entity of their singular, e.g. "stocks" and the asset class "Stock"
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=4)
+def entity_words(values: frozenset[str]) -> frozenset[str]:
+    # The words of the categorical values, e.g. "tesla" and "inc" for "Tesla Inc."
+    return frozenset(
+        normalize_word(word)
+        for value in values
+        for word in WORD.findall(value)
+        if len(word) > 1
+    )
+
+
+def question_entities(question: str, values: frozenset[str] = frozenset()) -> str:
+    """
+    Extracts the entities a semantic match must share exactly: the client IDs, the numbers, the ticker symbols, the
+    words of the categorical values of the tables, and the comparisons.
+
+    Args:
+        question (str): The text of the question.
+        values (frozenset[str]): The categorical values of the tables, e.g. the asset classes and the asset names.
+
+    Returns:
+        str: The sorted entities, e.g. '40.0,<,TSLA,client_1,stock'.
+    """
+    entities = {f"client_{number}" for number in CLIENT_ID.findall(question)}
+    rest = CLIENT_ID.sub(" ", question)
+    entities.update(str(float(number)) for number in NUMBER.findall(rest))
+    entities.update(SYMBOL.findall(rest))
+    entities.update(OPERATOR.findall(rest))
+
+    vocabulary = entity_words(values)
+    for word in WORD.findall(rest):
+        word = normalize_word(word)
+        if word in COMPARISON_WORDS:
+            entities.add(COMPARISON_WORDS[word])
+        elif word in vocabulary:
+            entities.add(word)
+    return ",".join(sorted(entities))
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    LLM cache persisted in a local SQLite file, with an exact tier and an optional semantic tier.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        max_entries (int): The maximum number of cached completions, the least recently used ones are evicted first.
+        ttl_seconds (float): Seconds after which a cached completion expires.
+        embeddings (Embeddings): The embedding model of the semantic tier, None disables the semantic tier.
+        similarity_threshold (float): The minimum cosine similarity between two questions for a semantic match.
+        categorical_values (Callable[[], frozenset[str]]): Returns the categorical values of the tables, whose words
+            a semantic match must share, e.g. the asset classes and the asset names.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 24 * 60 * 60,
+        embeddings: Optional[Embeddings] = None,
+        similarity_threshold: float = 0.95,
+        categorical_values: Optional[Callable[[], frozenset[str]]] = None,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.categorical_values = categorical_values
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                context_key TEXT,
+                embedding BLOB,
+                generations TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_context_key ON llm_cache (context_key)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)"
+        )
+        self._connection.commit()
+
+    def _semantic_key(self, prompt: str, llm_string: str) -> Optional[tuple[str, str]]:
+        """
+        Splits a prompt into the key of its context and the text of its last question.
+
+        Args:
+            prompt (str): The serialized messages sent to the model.
+            llm_string (str): The serialized model parameters.
+
+        Returns:
+            Optional[tuple[str, str]]: The context key and the question, None if the prompt has no question.
+        """
+        try:
+            messages: Sequence[BaseMessage] = loads(prompt)
+        except Exception:
+            return None
+
+        for index in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[index], HumanMessage):
+                question = messages[index].content
+                # The question is replaced by its entities, everything else must match exactly
+                question = str(question)
+                values = (
+                    self.categorical_values()
+                    if self.categorical_values is not None
+                    else frozenset()
+                )
+                context = [
+                    *messages[:index],
+                    HumanMessage(question_entities(question, values)),
+                    *messages[index + 1 :],
+                ]
+                return sha256(llm_string + dumps(context)), question
+        return None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """
+        Looks up the completion of a prompt, first exactly then semantically.
+
+        Args:
+            prompt (str): The serialized messages sent to the model.
+            llm_string (str): The serialized model parameters, including the bound tools.
+
+        Returns:
+            Optional[RETURN_VAL_TYPE]: The cached generations, None on a miss.
+        """
+        now = time.time()
+        key = sha256(llm_string + prompt)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT generations FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                return self._hit(key, row[0], now)
+
+        if self.embeddings is None:
+            return None
+
+        semantic_key = self._semantic_key(prompt, llm_string)
+        if semantic_key is None:
+            return None
+        context_key, question = semantic_key
+
+        with self._lock:
+            candidates = self._connection.execute(
+                """
+                SELECT key, embedding, generations FROM llm_cache
+                WHERE context_key = ? AND embedding IS NOT NULL AND created_at > ?
+                """,
+                (context_key, now - self.ttl_seconds),
+            ).fetchall()
+        if not candidates:
+            return None
+
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vectors = np.stack([np.frombuffer(c[1], dtype=np.float32) for c in candidates])
+        similarities = (
+            vectors
+            @ query
+            / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        l.info(f"Semantic LLM cache hit with similarity {similarities[best]:.3f}")
+        with self._lock:
+            return self._hit(candidates[best][0], candidates[best][2], now)
+
+    def _hit(self, key: str, generations: str, now: float) -> RETURN_VAL_TYPE:
+        self._connection.execute(
+            "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        self._connection.commit()
+        return loads(generations)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """
+        Stores the completion of a prompt and evicts the expired and least recently used entries.
+
+        Args:
+            prompt (str): The serialized messages sent to the model.
+            llm_string (str): The serialized model parameters, including the bound tools.
+            return_val (RETURN_VAL_TYPE): The generations returned by the model.
+        """
+        context_key, embedding = None, None
+        if self.embeddings is not None:
+            semantic_key = self._semantic_key(prompt, llm_string)
+            if semantic_key is not None:
+                context_key, question = semantic_key
+                embedding = np.asarray(
+                    self.embeddings.embed_query(question), dtype=np.float32
+                ).tobytes()
+
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache
+                (key, context_key, embedding, generations, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    sha256(llm_string + prompt),
+                    context_key,
+                    embedding,
+                    dumps(list(return_val)),
+                    now,
+                    now,
+                ),
+            )
+            self._connection.execute(
+                "DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl_seconds,)
+            )
+            self._connection.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        """
+        Removes every cached completion.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
@@ -0,0 +1,157 @@
+"""
+Module Overview
+---------------
+This module centralizes the runtime settings of the application.
+Every setting has a sensible default and can be overridden through an environment variable, so the same code
+can run on a laptop, under several workers or in a benchmark without edits.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: Functions to read typed values from the environment.
+- Settings: The settings used by the API and the agent.
+
+Example usage:
+    from src.config import MAX_CONCURRENT_GENERATIONS
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes", "on") if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# API
+# Maximum number of agent runs a single worker executes at the same time, extra requests wait for a free slot.
+MAX_CONCURRENT_GENERATIONS = _env_int("AGENT_MAX_CONCURRENCY", 8)
+# Maximum number of tool calls a single worker runs at the same time, the calls of an agent step run in parallel.
+TOOL_MAX_CONCURRENCY = _env_int("TOOL_MAX_CONCURRENCY", 8)
+
+# Deployment
+# Several worker processes serve the API, e.g. under gunicorn: the histories are shared through SQLite, and every
+# process picks up the tables rebuilt by another one.
+MULTI_PROCESS = _env_bool("MULTI_PROCESS", False)
+
+# Conversation memory
+# Maximum number of sessions kept in memory, the least recently used one is evicted first.
+HISTORY_MAX_SESSIONS = _env_int("HISTORY_MAX_SESSIONS", 1000)
+# Seconds of inactivity after which a session is forgotten.
+HISTORY_SESSION_TTL_SECONDS = _env_int("HISTORY_SESSION_TTL_SECONDS", 3600)
+# Maximum number of messages kept per session, older messages are dropped first.
+HISTORY_MAX_MESSAGES = _env_int("HISTORY_MAX_MESSAGES", 20)
+# Where histories are kept: "memory", or "sqlite" to survive restarts and to be shared by the worker processes.
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite" if MULTI_PROCESS else "memory")
+# SQLite file used by the "sqlite" history backend, separate from the data database.
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "data/history.db")
+# Maximum seconds an appended message waits in the write-behind queue before reaching the disk.
+# Defaults to 0 with several processes, which read back what the others wrote as soon as a request ends.
+HISTORY_FLUSH_INTERVAL_SECONDS = _env_float(
+    "HISTORY_FLUSH_INTERVAL_SECONDS", 0.0 if MULTI_PROCESS else 0.5
+)
+
+# Batch generation
+# Maximum number of items accepted in a single batch request.
+BATCH_MAX_ITEMS = _env_int("BATCH_MAX_ITEMS", 500)
+# Maximum number of items of a batch processed at the same time.
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", 8)
+# Seconds after which a single item of a batch is abandoned and reported as an error.
+BATCH_ITEM_TIMEOUT_SECONDS = _env_float("BATCH_ITEM_TIMEOUT_SECONDS", 60)
+
+# SQL tool
+# SQLite file holding the tables queried by the SQL tool.
+SQL_AGENT_DB_PATH = os.getenv("SQL_AGENT_DB_PATH", "data/database.db")
+# Folder containing the CSV files the tables are built from.
+SQL_AGENT_CSV_FOLDER = os.getenv("SQL_AGENT_CSV_FOLDER", "data")
+# Ingest the CSV files that changed when the process starts, false when the database is built by a separate step.
+SQL_INGEST_ON_STARTUP = _env_bool("SQL_INGEST_ON_STARTUP", True)
+# Number of CSV rows converted and written per transaction while ingesting, bounds the memory used by the ingest.
+INGEST_CHUNK_ROWS = _env_int("INGEST_CHUNK_ROWS", 50_000)
+# Engine running the SQL tool queries: "sqlite", or "duckdb" for columnar execution of analytical queries.
+SQL_BACKEND = os.getenv("SQL_BACKEND", "sqlite")
+# Threads used by the duckdb backend per query, 0 uses every core.
+DUCKDB_THREADS = _env_int("DUCKDB_THREADS", 0)
+# Maximum number of SQL tool results kept in the in-memory result cache.
+SQL_CACHE_MAX_ENTRIES = _env_int("SQL_CACHE_MAX_ENTRIES", 1024)
+# Maximum number of read-only connections open on the data database, extra queries wait for a free one.
+SQL_POOL_SIZE = _env_int("SQL_POOL_SIZE", 8)
+# Bytes of the data database memory mapped by each pooled connection.
+SQLITE_MMAP_SIZE = _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+# KiB of page cache of each pooled connection.
+SQLITE_CACHE_SIZE_KIB = _env_int("SQLITE_CACHE_SIZE_KIB", 64 * 1024)
+# Log the query plan of every SQL tool query and warn about full table scans, to grow the index set from real traffic.
+SQL_EXPLAIN_QUERY_PLAN = _env_bool("SQL_EXPLAIN_QUERY_PLAN", False)
+# Seconds after which an SQL tool query is aborted, 0 disables the limit.
+SQL_QUERY_TIMEOUT_SECONDS = _env_float("SQL_QUERY_TIMEOUT_SECONDS", 5)
+# SQLite virtual machine instructions after which an SQL tool query is aborted, 0 disables the limit.
+SQL_QUERY_MAX_VM_STEPS = _env_int("SQL_QUERY_MAX_VM_STEPS", 0)
+# Maximum number of rows of an SQL tool result, longer results are paginated.
+SQL_MAX_RESULT_ROWS = _env_int("SQL_MAX_RESULT_ROWS", 200)
+# Estimated tokens of an SQL tool result above which it is summarized instead of listed in full.
+SQL_RESULT_TOKEN_BUDGET = _env_int("SQL_RESULT_TOKEN_BUDGET", 1000)
+# Decimals the floats of an SQL tool result are rounded to.
+SQL_RESULT_DECIMALS = _env_int("SQL_RESULT_DECIMALS", 2)
+
+# LLM cache
+# Tiers of the LLM response cache: "off", "exact", or "semantic" to also reuse answers to near-duplicate questions.
+LLM_CACHE = os.getenv("LLM_CACHE", "exact")
+# SQLite file holding the cached LLM responses.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+# Maximum number of cached LLM responses, the least recently used ones are evicted first.
+LLM_CACHE_MAX_ENTRIES = _env_int("LLM_CACHE_MAX_ENTRIES", 10_000)
+# Seconds after which a cached LLM response expires.
+LLM_CACHE_TTL_SECONDS = _env_float("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60)
+# Minimum cosine similarity between two questions for the semantic tier to reuse an answer.
+LLM_CACHE_SIMILARITY_THRESHOLD = _env_float("LLM_CACHE_SIMILARITY_THRESHOLD", 0.95)
+
+# Fast path
+# Answer the known question shapes, e.g. the target allocation of an asset class for a client, without the LLM.
+FAST_PATH_ENABLED = _env_bool("FAST_PATH_ENABLED", True)
+
+# Few-shot examples
+# Embedding model of the few-shot example selector: "openai", or "local" to embed with a sentence-transformers model.
+FEW_SHOT_EMBEDDINGS = os.getenv("FEW_SHOT_EMBEDDINGS", "openai")
+# sentence-transformers model used when FEW_SHOT_EMBEDDINGS is "local".
+FEW_SHOT_LOCAL_MODEL = os.getenv(
+    "FEW_SHOT_LOCAL_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+# Folder holding the persisted example vectors, one subfolder per embedding model.
+FEW_SHOT_INDEX_DIR = os.getenv("FEW_SHOT_INDEX_DIR", "data/few_shot_index")
+# Maximum number of question embeddings kept in the in-memory LRU cache.
+EMBEDDING_CACHE_MAX_ENTRIES = _env_int("EMBEDDING_CACHE_MAX_ENTRIES", 1024)
+
+# Prompt
+# Maximum number of tokens of the schema section of the system prompt, details are dropped until it fits.
+PROMPT_SCHEMA_TOKEN_BUDGET = _env_int("PROMPT_SCHEMA_TOKEN_BUDGET", 800)
+# Text columns with at most this many distinct values have all their values listed in the system prompt.
+PROMPT_MAX_DISTINCT_VALUES = _env_int("PROMPT_MAX_DISTINCT_VALUES", 16)
+
+# Metrics
+# Add a Server-Timing header with the per-stage durations to the responses, e.g. to read them from the browser devtools.
+METRICS_SERVER_TIMING = _env_bool("METRICS_SERVER_TIMING", False)
+
+# Logging
+# Level of the root logger, records below it are dropped before they reach the queue.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Format of the console logs: "text" for humans, or "json" for log collectors. The log file is always JSON lines.
+LOG_CONSOLE_FORMAT = os.getenv("LOG_CONSOLE_FORMAT", "text")
+# Path of the log file, suffixed with the PID of each worker when MULTI_PROCESS is set, as rotation is per process.
+LOG_FILE = os.getenv("LOG_FILE", "src/logger/app.log")
+# The log file is rotated once it reaches this size, keeping LOG_BACKUP_COUNT previous files.
+LOG_MAX_BYTES = _env_int("LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = _env_int("LOG_BACKUP_COUNT", 5)
+# Share of the requests whose agent steps (tool calls, tool results, final answer) are logged, between 0 and 1.
+AGENT_TRACE_SAMPLE_RATE = _env_float("AGENT_TRACE_SAMPLE_RATE", 0.05)
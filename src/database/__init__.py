@@ -0,0 +1,7 @@
+# src/database/__init__.py
+
+from .backends import DuckDBBackend, QueryBackend, SQLiteBackend  # noqa: F401
+from .backends import QueryError, QueryTimeoutError  # noqa: F401
+from .ingest import TABLE_INDEXES, TABLE_SCHEMAS, TABLE_SOURCES  # noqa: F401
+from .ingest import ingest_lock, ingest_tables  # noqa: F401
+from .pool import SQLiteConnectionPool  # noqa: F401
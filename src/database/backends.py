@@ -0,0 +1,350 @@
+"""
+Module Overview
+---------------
+This module provides the query backends the SQL tool can run its queries on.
+Every backend exposes the same interface and returns the same result format, the column names and the rows as tuples,
+so the agent is unaware of which engine answers. The SQLite backend runs the queries on the pool of read-only
+connections to the ingested database. The optional DuckDB backend loads the same CSV (or Parquet) files into an
+in-process columnar engine, which runs the aggregates the agent generates with vectorized, multi-core execution.
+Since the queries are written by a model, every backend can abort a query running past a time budget and stream a
+bounded window of the rows with `fetchmany`, so an accidental cross join does not hold a worker or its memory. The
+errors of the engines are raised as `QueryError`, and the aborted queries as `QueryTimeoutError`.
+Each page of a result runs its query again, so the rows must come back in the same order every time. SQLite scans in
+a stable order, but the parallel scans of DuckDB do not, so a windowed DuckDB query without an ORDER BY is ordered by
+all of its columns.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Exceptions: The errors raised by every backend.
+- Helpers: Functions to fetch a window of the rows and to order a query deterministically.
+- Classes: The backend interface and its SQLite and DuckDB implementations.
+
+Example usage:
+    from src.database.backends import DuckDBBackend
+    from src.database.ingest import TABLE_SCHEMAS
+
+    backend = DuckDBBackend("data", {"allocations": "client_target_allocations.csv"}, TABLE_SCHEMAS)
+
+    columns, rows = backend.execute('SELECT "Asset Class", SUM("Target Allocation (%)") FROM allocations GROUP BY 1')
+
+    # Rows 201 to 300 of a query, aborted after 5 seconds
+    columns, rows = backend.execute('SELECT "Client", "Symbol" FROM advisors_clients', max_rows=100, offset=200, timeout=5)
+
+Note:
+    The DuckDB backend requires the `duckdb` package, which is not installed by default.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+
+from src.database.ingest import CSV_DATE_FORMAT
+from src.database.pool import SQLiteConnectionPool
+from src.logger.logger import l
+
+__all__ = [
+    "DuckDBBackend",
+    "QueryBackend",
+    "QueryError",
+    "QueryTimeoutError",
+    "SQLiteBackend",
+]
+
+DUCKDB_TYPES = {"TEXT": "VARCHAR", "REAL": "DOUBLE", "DATE": "DATE"}
+
+# Rows fetched from the engine at a time, the rows skipped by an offset are never all held in memory
+FETCH_BATCH_ROWS = 500
+
+# SQLite virtual machine instructions between two checks of the budget of a query
+PROGRESS_HANDLER_INSTRUCTIONS = 10_000
+
+
+class QueryError(Exception):
+    """
+    The engine failed to run a query, e.g. because of an unknown column or a type error.
+    """
+
+
+class QueryTimeoutError(QueryError):
+    """
+    The query was aborted because it ran past its time or instruction budget.
+    """
+
+
+def fetch_window(cursor, max_rows: Optional[int], offset: int) -> list[tuple]:
+    """
+    Fetches the rows of a cursor after skipping `offset` rows, at most `max_rows` of them, in batches.
+
+    Args:
+        cursor: A DB-API cursor holding the result of a query.
+        max_rows (int): The maximum number of rows returned, None returns every row.
+        offset (int): The number of rows skipped.
+
+    Returns:
+        list[tuple]: The rows of the window.
+    """
+    while offset > 0:
+        skipped = cursor.fetchmany(min(offset, FETCH_BATCH_ROWS))
+        if not skipped:
+            return []
+        offset -= len(skipped)
+
+    if max_rows is None:
+        return cursor.fetchall()
+
+    rows = []
+    while len(rows) < max_rows:
+        batch = cursor.fetchmany(min(max_rows - len(rows), FETCH_BATCH_ROWS))
+        if not batch:
+            break
+        rows.extend(batch)
+    return rows
+
+
+def order_deterministically(query: str, dialect: str) -> str:
+    """
+    Orders a query by all of its columns when it has no ORDER BY, so every run returns its rows in the same order.
+
+    Args:
+        query (str): The SQL query.
+        dialect (str): The SQL dialect of the engine, which must support `ORDER BY ALL`.
+
+    Returns:
+        str: The query, ordered by all of its columns if it was not ordered.
+    """
+    try:
+        expression = sqlglot.parse_one(query, read=dialect)
+    except sqlglot.errors.SqlglotError:
+        # The engine reports the error
+        return query
+    if not isinstance(expression, exp.Query) or expression.args.get("order"):
+        return query
+    return expression.order_by(exp.var("ALL")).sql(dialect=dialect)
+
+
+class QueryBackend(ABC):
+    """
+    Engine the SQL tool runs its queries on.
+
+    Attributes:
+        dialect (str): The sqlglot dialect queries must be rendered in for this engine.
+    """
+
+    dialect: str
+
+    @abstractmethod
+    def execute(
+        self,
+        query: str,
+        max_rows: Optional[int] = None,
+        offset: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[str], list[tuple]]:
+        """
+        Executes a read-only query.
+        To know whether a result continues past a window, ask for one more row than is shown.
+
+        Args:
+            query (str): The SQL query to be executed, in the dialect of the backend.
+            max_rows (int): The maximum number of rows returned, None returns every row.
+            offset (int): The number of leading rows of the result skipped.
+            timeout (float): Seconds after which the query is aborted, None or 0 lets it run to completion.
+
+        Returns:
+            tuple[list[str], list[tuple]]: The column names and the rows of the result.
+
+        Raises:
+            QueryTimeoutError: If the query ran past its budget.
+            QueryError: If the engine failed to run the query.
+        """
+
+    def reload(self) -> None:
+        """
+        Picks up the tables rebuilt by the last ingest.
+        """
+
+
+class SQLiteBackend(QueryBackend):
+    """
+    Backend running the queries on the pool of read-only connections to the ingested SQLite database.
+    The budget of a query is enforced by a progress handler, called every few thousand virtual machine instructions
+    while the query runs and while its rows are fetched, which interrupts the query once it is spent.
+
+    Attributes:
+        pool (SQLiteConnectionPool): The pool of read-only connections.
+        max_vm_steps (int): The virtual machine instructions after which a query is aborted, 0 disables the limit.
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, pool: SQLiteConnectionPool, max_vm_steps: int = 0):
+        self.pool = pool
+        self.max_vm_steps = max_vm_steps
+
+    def execute(
+        self,
+        query: str,
+        max_rows: Optional[int] = None,
+        offset: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[str], list[tuple]]:
+        with self.pool.connection() as connection:
+            budget_spent = self._set_budget(connection, timeout)
+            try:
+                cursor = connection.execute(query)
+                try:
+                    columns = [
+                        description[0] for description in cursor.description or []
+                    ]
+                    return columns, fetch_window(cursor, max_rows, offset)
+                finally:
+                    cursor.close()
+            except sqlite3.OperationalError as e:
+                if budget_spent():
+                    raise QueryTimeoutError(self._budget_message(timeout)) from e
+                raise QueryError(str(e)) from e
+            except sqlite3.Error as e:
+                raise QueryError(str(e)) from e
+            finally:
+                # The connection goes back to the pool without the budget of this query
+                connection.set_progress_handler(None, PROGRESS_HANDLER_INSTRUCTIONS)
+
+    def _set_budget(self, connection: sqlite3.Connection, timeout: Optional[float]):
+        """
+        Installs the progress handler enforcing the budget of a query.
+
+        Returns:
+            Callable[[], bool]: Tells whether the budget was spent, i.e. the query was interrupted by the handler.
+        """
+        deadline = time.perf_counter() + timeout if timeout else None
+        max_calls = self.max_vm_steps // PROGRESS_HANDLER_INSTRUCTIONS
+        state = {"calls": 0, "spent": False}
+
+        def progress_handler() -> int:
+            state["calls"] += 1
+            if (deadline is not None and time.perf_counter() > deadline) or (
+                max_calls and state["calls"] > max_calls
+            ):
+                state["spent"] = True
+                return 1
+            return 0
+
+        if deadline is not None or max_calls:
+            connection.set_progress_handler(
+                progress_handler, PROGRESS_HANDLER_INSTRUCTIONS
+            )
+        return lambda: state["spent"]
+
+    def _budget_message(self, timeout: Optional[float]) -> str:
+        limits = []
+        if timeout:
+            limits.append(f"{timeout:g} seconds")
+        if self.max_vm_steps:
+            limits.append(f"{self.max_vm_steps} steps")
+        return f"The query was aborted after {' or '.join(limits)}."
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Backend running the queries on an in-process DuckDB database loaded from the CSV or Parquet files.
+
+    Attributes:
+        data_folder (str): The folder containing the source files.
+        sources (dict[str, str]): The file name each table is loaded from.
+        schemas (dict[str, dict[str, str]]): The column types of each table, as used by the SQLite ingest.
+        threads (int): The number of threads DuckDB uses per query, 0 lets DuckDB use every core.
+    """
+
+    dialect = "duckdb"
+
+    def __init__(
+        self,
+        data_folder: str,
+        sources: dict[str, str],
+        schemas: dict[str, dict[str, str]],
+        threads: int = 0,
+    ):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError(
+                "The duckdb backend requires the duckdb package, install it with `pip install duckdb`."
+            ) from e
+
+        self.data_folder = data_folder
+        self.sources = sources
+        self.schemas = schemas
+        self.threads = threads
+        self._connection = duckdb.connect(":memory:")
+        if threads:
+            self._connection.execute(f"SET threads = {threads}")
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        with self._lock:
+            for table, file_name in self.sources.items():
+                source = os.path.join(self.data_folder, file_name).replace("'", "''")
+                schema = self.schemas.get(table, {})
+                if source.endswith(".parquet"):
+                    reader = f"read_parquet('{source}')"
+                else:
+                    # Same column types as the SQLite ingest, unknown columns are inferred
+                    types = ", ".join(
+                        f"'{column}': '{DUCKDB_TYPES[column_type]}'"
+                        for column, column_type in schema.items()
+                    )
+                    reader = (
+                        f"read_csv('{source}', types = {{{types}}}, "
+                        f"dateformat = '{CSV_DATE_FORMAT}')"
+                    )
+
+                # Dates are returned as ISO strings, like SQLite does
+                dates = [c for c, t in schema.items() if t == "DATE"]
+                replace = ", ".join(f'CAST("{c}" AS VARCHAR) AS "{c}"' for c in dates)
+                select = f"* REPLACE ({replace})" if dates else "*"
+
+                l.info(f"Loading {source} into DuckDB table {table}")
+                self._connection.execute(
+                    f'CREATE OR REPLACE TABLE "{table}" AS SELECT {select} FROM {reader}'
+                )
+
+    def execute(
+        self,
+        query: str,
+        max_rows: Optional[int] = None,
+        offset: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[str], list[tuple]]:
+        import duckdb
+
+        # Each query gets its own cursor, DuckDB runs cursors of the same database concurrently
+        with self._lock:
+            cursor = self._connection.cursor()
+        # DuckDB has no progress handler, a timer interrupts the cursor instead
+        timer = threading.Timer(timeout, cursor.interrupt) if timeout else None
+        try:
+            if timer is not None:
+                timer.start()
+            if max_rows is not None or offset:
+                query = order_deterministically(query, self.dialect)
+            cursor.execute(query)
+            columns = [description[0] for description in cursor.description or []]
+            return columns, fetch_window(cursor, max_rows, offset)
+        except duckdb.InterruptException as e:
+            raise QueryTimeoutError(
+                f"The query was aborted after {timeout:g} seconds."
+            ) from e
+        except duckdb.Error as e:
+            raise QueryError(str(e)) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
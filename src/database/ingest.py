@@ -0,0 +1,464 @@
+"""
+Module Overview
+---------------
+This module loads the CSV files into the SQLite database incrementally.
+An ingest manifest stored in the database keeps the size, modification time and SHA-256 hash of the CSV file each
+table was built from. A table is rebuilt only when its source changed, so a cold start with unchanged files is a
+cheap metadata check instead of a full reload. Files whose size and modification time did not change are not even
+hashed.
+Files are streamed into the database in chunks of rows, converted to explicit column types with dates normalized to
+ISO format, and written with `executemany` in one transaction per chunk, so multi-GB extracts load in bounded memory.
+A table is built under a temporary name and swapped in once complete, so readers never see a half loaded table.
+After ingesting, the hot filter and group by columns of each table are indexed and `ANALYZE` refreshes the planner
+statistics, so the queries generated by the agent use index lookups instead of full table scans.
+When several processes start on the same database, e.g. the workers of a gunicorn server, the ingest is serialized
+by an exclusive lock on a file next to the database: the first process builds the tables, the others wait and then
+find them up to date.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Global Variables: The CSV file each table is built from, the column types of each table and the columns indexed on
+  each table.
+- Functions: Functions to fingerprint files, read and write the manifest, stream a CSV file into a table, create
+  indexes, lock the database across processes, and ingest the tables.
+
+Example usage:
+    import sqlite3
+
+    from src.database.ingest import ingest_tables
+
+    connection = sqlite3.connect("data/database.db")
+
+    # Rebuilding only the tables whose CSV file changed since the last ingest, one process at a time
+    with ingest_lock("data/database.db.lock"):
+        rebuilt_tables = ingest_tables(connection, "data")
+"""
+
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Iterator, Optional
+
+from src.logger.logger import l
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+__all__ = [
+    "TABLE_INDEXES",
+    "TABLE_SCHEMAS",
+    "TABLE_SOURCES",
+    "file_fingerprint",
+    "ingest_lock",
+    "ingest_tables",
+    "stream_csv_into_table",
+]
+
+TABLE_SOURCES = {
+    "allocations": "client_target_allocations.csv",
+    "advisors_clients": "financial_advisor_clients.csv",
+}
+
+# Column types of each table, columns missing from a schema are stored as TEXT
+TABLE_SCHEMAS = {
+    "allocations": {
+        "Client": "TEXT",
+        "Target Portfolio": "TEXT",
+        "Asset Class": "TEXT",
+        "Target Allocation (%)": "REAL",
+    },
+    "advisors_clients": {
+        "Client": "TEXT",
+        "Symbol": "TEXT",
+        "Name": "TEXT",
+        "Sector": "TEXT",
+        "Quantity": "REAL",
+        "Buy Price": "REAL",
+        "Current Price": "REAL",
+        "Market Value": "REAL",
+        "Purchase Date": "DATE",
+        "Dividend Yield": "REAL",
+        "P/E Ratio": "REAL",
+        "52-Week High": "REAL",
+        "52-Week Low": "REAL",
+        "Analyst Rating": "TEXT",
+        "Target Price": "REAL",
+        "Risk Level": "TEXT",
+    },
+}
+
+# Format of the dates in the CSV files, they are stored as ISO dates (YYYY-MM-DD)
+CSV_DATE_FORMAT = "%m/%d/%y"
+
+# Columns the agent filters and groups on, each tuple becomes one index
+TABLE_INDEXES = {
+    "allocations": [
+        ("Client", "Asset Class"),
+        ("Asset Class",),
+        ("Target Portfolio",),
+    ],
+    "advisors_clients": [
+        ("Client",),
+        ("Symbol",),
+        ("Sector",),
+        ("Analyst Rating",),
+        ("Risk Level",),
+    ],
+}
+
+MANIFEST_TABLE = "_ingest_manifest"
+
+# Bumped whenever the way tables are built changes, databases built by an older version are rebuilt
+INGEST_FORMAT_VERSION = 1
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Computes the SHA-256 hash of a file, reading it in chunks.
+
+    Args:
+        path (str): The path of the file.
+        chunk_size (int): The number of bytes read at a time.
+
+    Returns:
+        str: The hexadecimal digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str) -> dict:
+    """
+    Returns the size, modification time and SHA-256 hash of a file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        dict: The fingerprint of the file.
+    """
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_sha256(path),
+    }
+
+
+def read_manifest(connection: sqlite3.Connection, table: str) -> Optional[dict]:
+    connection.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL
+        )
+        """
+    )
+    row = connection.execute(
+        f"SELECT source, size, mtime_ns, sha256 FROM {MANIFEST_TABLE} WHERE table_name = ?",
+        (table,),
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(["source", "size", "mtime_ns", "sha256"], row))
+
+
+def write_manifest(
+    connection: sqlite3.Connection, table: str, source: str, fingerprint: dict
+) -> None:
+    connection.execute(
+        f"""
+        INSERT OR REPLACE INTO {MANIFEST_TABLE} (table_name, source, size, mtime_ns, sha256)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            table,
+            source,
+            fingerprint["size"],
+            fingerprint["mtime_ns"],
+            fingerprint["sha256"],
+        ),
+    )
+
+
+def table_exists(connection: sqlite3.Connection, table: str) -> bool:
+    row = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def is_up_to_date(
+    connection: sqlite3.Connection, table: str, source: str
+) -> tuple[bool, Optional[dict]]:
+    """
+    Checks whether a table was built from the current content of its CSV file.
+
+    Args:
+        connection (sqlite3.Connection): A read-write connection to the database.
+        table (str): The name of the table.
+        source (str): The path of the CSV file the table is built from.
+
+    Returns:
+        tuple[bool, Optional[dict]]: Whether the table is up to date, and the fingerprint of the file if it had to be hashed.
+    """
+    manifest = read_manifest(connection, table)
+    if manifest is None or manifest["source"] != source:
+        return False, None
+    if not table_exists(connection, table):
+        return False, None
+
+    stat = os.stat(source)
+    if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+        return True, None
+
+    # The file was touched, only its content tells whether it really changed
+    fingerprint = file_fingerprint(source)
+    return manifest["sha256"] == fingerprint["sha256"], fingerprint
+
+
+def create_indexes(
+    connection: sqlite3.Connection, table: str, indexes: list[tuple[str, ...]]
+) -> int:
+    """
+    Creates the missing indexes of a table.
+
+    Args:
+        connection (sqlite3.Connection): A read-write connection to the database.
+        table (str): The name of the table.
+        indexes (list[tuple[str, ...]]): The columns of each index.
+
+    Returns:
+        int: The number of indexes created.
+    """
+    existing = {
+        row[0]
+        for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+            (table,),
+        )
+    }
+
+    created = 0
+    for columns in indexes:
+        name = "idx_" + "_".join(
+            "".join(c if c.isalnum() else "_" for c in part.lower())
+            for part in (table, *columns)
+        )
+        if name in existing:
+            continue
+        quoted_columns = ", ".join(f'"{column}"' for column in columns)
+        connection.execute(f'CREATE INDEX "{name}" ON "{table}" ({quoted_columns})')
+        created += 1
+
+    return created
+
+
+def to_real(value: str) -> Optional[float]:
+    return float(value) if value else None
+
+
+def to_text(value: str) -> Optional[str]:
+    return value if value else None
+
+
+def to_iso_date(value: str) -> Optional[str]:
+    return (
+        datetime.strptime(value, CSV_DATE_FORMAT).date().isoformat() if value else None
+    )
+
+
+CONVERTERS: dict[str, Callable[[str], Any]] = {
+    "REAL": to_real,
+    "TEXT": to_text,
+    "DATE": to_iso_date,
+}
+
+
+def stream_csv_into_table(
+    connection: sqlite3.Connection,
+    table: str,
+    source: str,
+    schema: dict[str, str],
+    chunk_rows: int = 50_000,
+) -> int:
+    """
+    Streams a CSV file into a new table, chunk by chunk, and swaps it with the existing table once complete.
+
+    Args:
+        connection (sqlite3.Connection): A read-write connection to the database.
+        table (str): The name of the table.
+        source (str): The path of the CSV file.
+        schema (dict[str, str]): The type of each column, TEXT, REAL or DATE.
+        chunk_rows (int): The number of rows read, converted and written per transaction.
+
+    Returns:
+        int: The number of rows written.
+    """
+    staging_table = f"{table}__ingest"
+    file_size = os.path.getsize(source)
+    started_at = time.perf_counter()
+    written_rows = 0
+    invalid_values = 0
+
+    with open(source, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        columns = next(reader)
+        types = [schema.get(column, "TEXT") for column in columns]
+        converters = [CONVERTERS[column_type] for column_type in types]
+
+        quoted_columns = [f'"{column}"' for column in columns]
+        with connection:
+            connection.execute(f'DROP TABLE IF EXISTS "{staging_table}"')
+            connection.execute(
+                f'CREATE TABLE "{staging_table}" ('
+                + ", ".join(f"{c} {t}" for c, t in zip(quoted_columns, types))
+                + ")"
+            )
+        insert = (
+            f'INSERT INTO "{staging_table}" ({", ".join(quoted_columns)}) '
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+
+        while True:
+            chunk = []
+            for line in islice(reader, chunk_rows):
+                row = []
+                for converter, value in zip(converters, line):
+                    try:
+                        row.append(converter(value))
+                    except ValueError:
+                        invalid_values += 1
+                        row.append(None)
+                # Short lines are padded with nulls, extra values were dropped by zip
+                row.extend([None] * (len(columns) - len(row)))
+                chunk.append(row)
+            if not chunk:
+                break
+
+            with connection:
+                connection.executemany(insert, chunk)
+            written_rows += len(chunk)
+
+            # The text layer cannot tell its position while iterated, the byte buffer below it can
+            read_bytes = file.buffer.tell()
+            elapsed = time.perf_counter() - started_at
+            l.info(
+                f"Ingested {written_rows} rows into {table} "
+                f"({read_bytes / file_size if file_size else 1:.0%}) "
+                f"at {written_rows / elapsed:,.0f} rows/s, "
+                f"{read_bytes / elapsed / 1024 / 1024:,.1f} MB/s"
+            )
+
+    if invalid_values:
+        l.warning(
+            f"{invalid_values} values of {source} could not be converted, stored as null"
+        )
+
+    with connection:
+        connection.execute(f'DROP TABLE IF EXISTS "{table}"')
+        connection.execute(f'ALTER TABLE "{staging_table}" RENAME TO "{table}"')
+
+    return written_rows
+
+
+@contextmanager
+def ingest_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on a file, so a single process ingests at a time. The lock is released by the operating
+    system if the process dies. Without `fcntl`, e.g. on Windows, nothing is locked.
+
+    Args:
+        path (str): The path of the lock file, created if needed.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(path, "a") as file:
+        start = time.perf_counter()
+        fcntl.flock(file, fcntl.LOCK_EX)
+        waited = time.perf_counter() - start
+        if waited > 0.1:
+            l.info(f"Waited {waited:.1f}s for another process to finish its ingest")
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def ingest_tables(
+    connection: sqlite3.Connection,
+    csv_folder: str,
+    sources: dict[str, str] = TABLE_SOURCES,
+    force: bool = False,
+    indexes: dict[str, list[tuple[str, ...]]] = TABLE_INDEXES,
+    chunk_rows: int = 50_000,
+) -> list[str]:
+    """
+    Rebuilds the tables whose CSV file changed since the last ingest and records their new fingerprints.
+
+    Args:
+        connection (sqlite3.Connection): A read-write connection to the database.
+        csv_folder (str): The folder containing the CSV files.
+        sources (dict[str, str]): The CSV file name each table is built from.
+        force (bool): Rebuild every table, even the up to date ones.
+        indexes (dict[str, list[tuple[str, ...]]]): The columns of each index of each table.
+        chunk_rows (int): The number of rows written per transaction.
+
+    Returns:
+        list[str]: The names of the rebuilt tables.
+    """
+    (format_version,) = connection.execute("PRAGMA user_version").fetchone()
+    if format_version != INGEST_FORMAT_VERSION:
+        l.info(
+            f"Database built by ingest format {format_version}, rebuilding every table"
+        )
+        force = True
+
+    rebuilt_tables = []
+    for table, file_name in sources.items():
+        source = os.path.join(csv_folder, file_name)
+
+        up_to_date, fingerprint = is_up_to_date(connection, table, source)
+        if up_to_date and not force:
+            if fingerprint is not None:
+                write_manifest(connection, table, source, fingerprint)
+                connection.commit()
+            l.info(f"Table {table} is up to date with {source}, skipping ingest")
+            continue
+
+        l.info(f"Ingesting {source} into table {table}")
+        fingerprint = fingerprint or file_fingerprint(source)
+        stream_csv_into_table(
+            connection, table, source, TABLE_SCHEMAS.get(table, {}), chunk_rows
+        )
+        write_manifest(connection, table, source, fingerprint)
+        connection.commit()
+        rebuilt_tables.append(table)
+
+    # Indexes are checked on every table, so a database built before an index was added gets it too
+    created_indexes = sum(
+        create_indexes(connection, table, indexes.get(table, [])) for table in sources
+    )
+    if rebuilt_tables or created_indexes:
+        l.info(f"Created {created_indexes} indexes, refreshing planner statistics")
+        connection.execute("ANALYZE")
+    connection.execute(f"PRAGMA user_version = {INGEST_FORMAT_VERSION}")
+    connection.commit()
+
+    return rebuilt_tables
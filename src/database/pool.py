@@ -0,0 +1,97 @@
+"""
+Module Overview
+---------------
+This module provides a bounded pool of read-only SQLite connections used to run the queries of the SQL tool.
+Connections are opened once with the `mode=ro` URI, tuned with memory mapping and page cache pragmas, and reused
+across calls, so concurrent agent runs query the database in parallel without paying a connect on every call and
+without ever taking the writer lock. The database is expected to be in WAL mode, which lets readers proceed while
+the tables are being reloaded.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Classes: The connection pool.
+
+Example usage:
+    from src.database.pool import SQLiteConnectionPool
+
+    pool = SQLiteConnectionPool("data/database.db", max_connections=8)
+
+    with pool.connection() as connection:
+        rows = connection.execute("SELECT * FROM allocations LIMIT 1").fetchall()
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+__all__ = ["SQLiteConnectionPool"]
+
+
+class SQLiteConnectionPool:
+    """
+    Bounded pool of read-only SQLite connections, checked out for the duration of a query.
+
+    Attributes:
+        path (str): The path of the SQLite database.
+        max_connections (int): The maximum number of connections open at the same time, extra callers wait.
+        mmap_size (int): Bytes of the database file memory mapped by each connection.
+        cache_size_kib (int): KiB of page cache of each connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_connections: int = 8,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_size_kib: int = 64 * 1024,
+    ):
+        self.path = path
+        self.max_connections = max_connections
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+        connection.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        connection.execute(f"PRAGMA cache_size=-{self.cache_size_kib}")
+        connection.execute("PRAGMA query_only=1")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Checks out a connection, opening one if none is idle, and returns it to the pool afterwards.
+
+        Yields:
+            sqlite3.Connection: A read-only connection to the database.
+        """
+        self._slots.acquire()
+        try:
+            try:
+                # The most recently used connection is reused first, its caches are the warmest
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            finally:
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """
+        Closes every idle connection, the pool opens new ones on the next checkout.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,94 @@
+"""
+Module Overview
+---------------
+This module logs the steps of the agent for a sample of the requests, in place of the `verbose` output of the agent
+executor, which prints every step of every request to the standard output.
+A request is sampled when it starts, with the probability set by `AGENT_TRACE_SAMPLE_RATE`, and the decision is kept
+in the log context, so every step of a sampled request is logged and no step of the others.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Functions: The sampling decision.
+- Classes: The LangChain callback handler logging the steps of the agent.
+
+Example usage:
+    from src.logger.agent_trace import AgentTraceCallbackHandler, sample_agent_trace
+
+    sample_agent_trace()
+    agent.invoke(inputs, {"callbacks": [AgentTraceCallbackHandler()]})
+    # Log: Agent calls sql_tool with {'query': 'SELECT ...'}
+    # Log: sql_tool returned [['Client_1'], ...]
+    # Log: Agent answered: Client_1 holds Tesla stocks.
+"""
+
+import random
+from typing import Any
+from uuid import UUID
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.config import AGENT_TRACE_SAMPLE_RATE
+from src.logger.logger import bind_log_context, l, log_context
+
+# Tool results can be whole tables, only their beginning is logged
+MAX_LOGGED_CHARS = 500
+
+
+def sample_agent_trace(rate: float = AGENT_TRACE_SAMPLE_RATE) -> bool:
+    """
+    Decides whether the steps of the agent are logged for the current request.
+
+    Args:
+        rate (float): The share of the requests whose steps are logged.
+
+    Returns:
+        bool: Whether the request is sampled.
+    """
+    sampled = random.random() < rate
+    bind_log_context(agent_trace=sampled)
+    return sampled
+
+
+def is_agent_trace_sampled() -> bool:
+    # Outside of a request, e.g. in a script, the steps are only logged when every request would be
+    return log_context.get().get("agent_trace", AGENT_TRACE_SAMPLE_RATE >= 1)
+
+
+def truncate(value: Any) -> str:
+    text = str(value)
+    if len(text) > MAX_LOGGED_CHARS:
+        return f"{text[:MAX_LOGGED_CHARS]}... ({len(text)} characters)"
+    return text
+
+
+class AgentTraceCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler logging the tool calls, the tool results and the final answer of the sampled requests.
+    """
+
+    # Logging only enqueues the record, there is no need for a thread
+    run_inline = True
+
+    def on_agent_action(
+        self, action: AgentAction, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if is_agent_trace_sampled():
+            l.info(f"Agent calls {action.tool} with {truncate(action.tool_input)}")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if is_agent_trace_sampled():
+            l.info(f"{kwargs.get('name') or 'Tool'} returned {truncate(output)}")
+
+    def on_tool_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if is_agent_trace_sampled():
+            l.warning(f"Tool failed: {truncate(error)}")
+
+    def on_agent_finish(
+        self, finish: AgentFinish, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if is_agent_trace_sampled():
+            l.info(f"Agent answered: {truncate(finish.return_values.get('output'))}")
@@ -3,63 +3,146 @@ Module Overview
 ---------------
 This module provides configuration for the logger used in the application.
 
-The module sets up the logging configuration using the `logging.config.dictConfig` method.
-It defines the loggers, handlers, and formatters to be used for logging.
-
-The `LOGGING_CONFIG` dictionary contains the configuration settings for the logger.
-It specifies the log format, log levels, log handlers, and log file location.
+Logging never blocks the request threads on a handler lock or a disk write: the root logger has a single
+`QueueHandler`, which only tags the record with the context of the request and enqueues it. A `QueueListener` thread
+takes the records off the queue and writes them to the console and to a size-rotated log file of JSON lines.
+Every record carries the request ID and the session ID bound to the current context, so the logs of a request can be
+followed across the agent, its tools and the threads they run in.
+Rotating a file is not safe across processes, so with `MULTI_PROCESS` every worker writes its own file, e.g.
+`app.4242.log` for the worker of PID 4242.
 
 Structure
 ---------
 - Imports: Necessary libraries and modules.
-- Logging Configuration: Dictionary containing the logging settings.
-- Logger Initialization: Setting up the logger with the configuration.
+- Log Context: The context variable holding the request ID and the session ID, and the filter copying them to records.
+- Formatters: The text and JSON formatters.
+- Logger Initialization: Setting up the queue, its listener and the output handlers.
 
 Example usage:
-    import logger
+    from src.logger.logger import bind_log_context, l
 
-    logger.module_function()
+    bind_log_context(request_id="3f2a9c", session_id="123")
+    l.info("Running the agent")
+    # Log file: {"time": "2024-07-15T10:12:03.512+00:00", "level": "INFO", "logger": "src.logger.logger", "file": "main.py", "line": 12, "message": "Running the agent", "request_id": "3f2a9c", "session_id": "123"}
 
 Note:
-    This module should be imported and the `module_function` should be called to configure the logger.
+    The logger is configured when this module is first imported, and the listener is stopped at exit so the queued
+    records are written.
 """
 
+import atexit
+import json
 import logging
-import logging.config
-
-LOGGING_CONFIG = {
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "standard": {"format": "[%(levelname)s] %(filename)s:%(lineno)d: %(message)s"},
-        "detailed": {
-            "format": "%(asctime)s [%(levelname)s] %(name)s (%(filename)s:%(lineno)d): %(message)s"
-        },
-    },
-    "handlers": {
-        "console": {
-            "level": "INFO",
-            "class": "logging.StreamHandler",
-            "formatter": "standard",
-        },
-        "file": {
-            "level": "INFO",
-            "class": "logging.FileHandler",
-            "formatter": "detailed",
-            "filename": "src/logger/app.log",
-            "mode": "a",
-        },
-    },
-    "loggers": {
-        "": {  # root logger
-            "handlers": ["console", "file"],
-            "level": "DEBUG",
-            "propagate": True,
+import os
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from src.config import (
+    LOG_BACKUP_COUNT,
+    LOG_CONSOLE_FORMAT,
+    LOG_FILE,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    MULTI_PROCESS,
+)
+
+CONTEXT_FIELDS = ("request_id", "session_id")
+
+log_context: ContextVar[dict] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields) -> None:
+    """
+    Adds fields, e.g. the request ID or the session ID, to the records logged from the current context.
+
+    Args:
+        **fields: The fields and their values.
+    """
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the fields of the log context to the record. Runs in the logging thread, before the record is enqueued.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object, with the fields of the log context when they are set.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage(),
         }
-    },
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        # The traceback of an exception is already part of the message, QueueHandler formats it before enqueuing
+        return json.dumps(entry, default=str)
+
+
+FORMATTERS = {
+    "text": logging.Formatter("[%(levelname)s] %(filename)s:%(lineno)d: %(message)s"),
+    "json": JSONFormatter(),
 }
 
 
-logging.config.dictConfig(LOGGING_CONFIG)
+def configure_logging() -> QueueListener:
+    """
+    Replaces the handlers of the root logger with a queue, and starts the thread writing the queued records to the
+    console and to the log file.
+
+    Returns:
+        QueueListener: The started listener.
+    """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(FORMATTERS[LOG_CONSOLE_FORMAT])
+
+    log_file = LOG_FILE
+    if MULTI_PROCESS:
+        root, extension = os.path.splitext(LOG_FILE)
+        log_file = f"{root}.{os.getpid()}{extension}"
+
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+    )
+    file_handler.setFormatter(FORMATTERS["json"])
+
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(records, console_handler, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = configure_logging()
 l = logging.getLogger(__name__)  # noqa: E741
 l.info("Logger initialized.")
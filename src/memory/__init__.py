@@ -0,0 +1,6 @@
+# src/memory/__init__.py
+
+from .session_registry import BoundedChatMessageHistory  # noqa: F401
+from .session_registry import SessionHistoryRegistry  # noqa: F401
+from .sqlite_history import SQLiteChatMessageHistory  # noqa: F401
+from .sqlite_history import SQLiteHistoryStore  # noqa: F401
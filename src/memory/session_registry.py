@@ -0,0 +1,118 @@
+"""
+Module Overview
+---------------
+This module provides a bounded, per-session registry of conversation histories for the agent.
+Each session gets its own history capped to a maximum number of messages, and the registry itself is capped to a
+maximum number of sessions, evicting the least recently used session first and forgetting sessions that have been
+inactive for longer than a time to live. Memory usage and prompt size stay flat no matter how long the server runs.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Classes: A chat message history with a message cap and the session registry.
+
+Example usage:
+    from src.memory.session_registry import SessionHistoryRegistry
+
+    registry = SessionHistoryRegistry(max_sessions=1000, ttl_seconds=3600, max_messages=20)
+
+    # Retrieving (or creating) the history of a session
+    history = registry.get("session_id_123")
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage
+
+__all__ = ["BoundedChatMessageHistory", "SessionHistoryRegistry"]
+
+
+class BoundedChatMessageHistory(BaseChatMessageHistory):
+    """
+    In memory chat message history that keeps only the most recent messages.
+
+    Attributes:
+        max_messages (int): The maximum number of messages kept, older messages are dropped first.
+    """
+
+    def __init__(self, max_messages: int):
+        self.max_messages = max_messages
+        self._messages: deque[BaseMessage] = deque(maxlen=max_messages)
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        return list(self._messages)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._messages.extend(messages)
+
+    def clear(self) -> None:
+        self._messages.clear()
+
+
+class SessionHistoryRegistry:
+    """
+    Registry of chat message histories keyed by session ID with LRU and TTL eviction.
+
+    Attributes:
+        max_sessions (int): The maximum number of sessions kept, the least recently used one is evicted first.
+        ttl_seconds (float): Seconds of inactivity after which a session is evicted.
+        max_messages (int): The maximum number of messages kept per session.
+        history_factory (Callable[[str], BaseChatMessageHistory]): Builds the history of a new session.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int,
+        ttl_seconds: float,
+        max_messages: int,
+        history_factory: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.history_factory = history_factory or (
+            lambda session_id: BoundedChatMessageHistory(max_messages)
+        )
+        self._sessions: OrderedDict[str, tuple[float, BaseChatMessageHistory]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """
+        Returns the history of a session, creating it if needed, and marks the session as recently used.
+
+        Args:
+            session_id (str): The session ID of the conversation.
+
+        Returns:
+            BaseChatMessageHistory: The history of the session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry else self.history_factory(session_id)
+            self._sessions[session_id] = (now, history)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            return history
+
+    def _evict_expired(self, now: float) -> None:
+        # Sessions are kept in access order, so the expired ones are always at the front
+        while self._sessions:
+            last_access, _ = next(iter(self._sessions.values()))
+            if now - last_access <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
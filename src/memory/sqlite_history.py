@@ -0,0 +1,296 @@
+"""
+Module Overview
+---------------
+This module provides a durable chat message history backed by a local SQLite file, separate from the data database.
+Conversation context survives process restarts without adding a synchronous disk write to every request: appends are
+pushed to a write-behind queue that a background thread flushes in batches, at most `flush_interval` seconds after the
+first queued operation, a session is loaded from disk only when it is first touched, and only its most recent messages
+are read, merged with its messages still waiting in the queue.
+When several worker processes serve the same sessions, a shared history reads the session back on every access and
+writes its appends before returning, so a follow-up question can land on any worker.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Classes: The SQLite store with its background writer and the chat message history built on top of it.
+
+Example usage:
+    from src.memory.sqlite_history import SQLiteChatMessageHistory, SQLiteHistoryStore
+
+    store = SQLiteHistoryStore("data/history.db")
+    history = SQLiteChatMessageHistory(store, "session_id_123", max_messages=20)
+
+    # Reading the most recent messages of the session, loaded from disk on first access
+    messages = history.messages
+
+Note:
+    A single `SQLiteHistoryStore` should be shared by every history of the process, it owns the writer thread.
+"""
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from src.logger.logger import l
+
+__all__ = ["SQLiteChatMessageHistory", "SQLiteHistoryStore"]
+
+
+class PendingSession:
+    """
+    The operations of a session waiting in the queue of a `SQLiteHistoryStore`.
+
+    Attributes:
+        cleared_seq (int): The sequence number of a pending clear of the session, None if there is none.
+        messages (deque[tuple[int, BaseMessage]]): The messages appended after it, with their sequence numbers.
+    """
+
+    def __init__(self, cleared_seq: Optional[int] = None):
+        self.cleared_seq = cleared_seq
+        self.messages: deque[tuple[int, BaseMessage]] = deque()
+
+
+class SQLiteHistoryStore:
+    """
+    SQLite file holding the messages of every session, written by a background thread in batches.
+    The operations waiting in the queue are also kept per session, so a session is read back without waiting for the
+    writes of the other sessions.
+
+    Attributes:
+        path (str): The path of the SQLite file.
+        flush_interval (float): Maximum seconds an operation waits in the queue before being written.
+        batch_size (int): Maximum number of queued operations written in a single transaction.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 256):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            )
+            """
+        )
+        self._reader.execute(
+            "CREATE INDEX IF NOT EXISTS messages_session_id ON messages (session_id, id)"
+        )
+        self._reader.commit()
+        # Held while reading a session, and by the writer while it commits a batch and drops it from the pending
+        # operations, so a read never sees an operation both on disk and pending, or on neither
+        self._disk_lock = threading.Lock()
+
+        # Sequence number of the last queued and of the last written operation, and the operations of each session
+        # waiting in the queue: a pending clear and the messages appended after it
+        self._pending_changed = threading.Condition()
+        self._queued_seq = 0
+        self._written_seq = 0
+        self._pending: dict[str, PendingSession] = {}
+
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._run, name="history-writer", daemon=True
+        )
+        self._writer.start()
+        atexit.register(self.close)
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        """
+        Queues messages to be appended to a session, returns without touching the disk.
+
+        Args:
+            session_id (str): The session ID of the conversation.
+            messages (Sequence[BaseMessage]): The messages to append.
+        """
+        rows = [(session_id, json.dumps(message_to_dict(m))) for m in messages]
+        with self._pending_changed:
+            seq = self._enqueue("append", rows)
+            pending = self._pending.setdefault(session_id, PendingSession())
+            pending.messages.extend((seq, message) for message in messages)
+
+    def clear(self, session_id: str) -> None:
+        """
+        Queues the deletion of every message of a session.
+
+        Args:
+            session_id (str): The session ID of the conversation.
+        """
+        with self._pending_changed:
+            seq = self._enqueue("clear", session_id)
+            # The messages queued before are deleted along with the ones on disk
+            self._pending[session_id] = PendingSession(cleared_seq=seq)
+
+    def load_recent(self, session_id: str, limit: int) -> list[BaseMessage]:
+        """
+        Reads the most recent messages of a session, oldest first, including the ones still waiting in the queue.
+
+        Args:
+            session_id (str): The session ID of the conversation.
+            limit (int): The maximum number of messages to read.
+
+        Returns:
+            list[BaseMessage]: The most recent messages of the session.
+        """
+        with self._disk_lock:
+            with self._pending_changed:
+                pending = self._pending.get(session_id, PendingSession())
+                cleared = pending.cleared_seq is not None
+                queued = [message for _, message in pending.messages]
+
+            messages = []
+            remaining = limit - len(queued)
+            if not cleared and remaining > 0:
+                rows = self._reader.execute(
+                    "SELECT message FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                    (session_id, remaining),
+                ).fetchall()
+                messages = messages_from_dict(
+                    [json.loads(row[0]) for row in reversed(rows)]
+                )
+        return (messages + queued)[-limit:] if limit > 0 else []
+
+    def flush(self) -> None:
+        """
+        Blocks until every operation queued before the call has been written.
+        """
+        with self._pending_changed:
+            target = self._queued_seq
+            self._pending_changed.wait_for(lambda: self._written_seq >= target)
+
+    def close(self) -> None:
+        """
+        Writes the queued operations and stops the writer thread.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _enqueue(self, kind: str, payload) -> int:
+        # Called under the lock of the pending operations, so the queue is in the order of the sequence numbers
+        self._queued_seq += 1
+        self._queue.put((self._queued_seq, kind, payload))
+        return self._queued_seq
+
+    def _next_batch(self) -> list:
+        # The interval runs from the first operation of the batch, so steady traffic does not postpone the write
+        operations = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(operations) < self.batch_size and operations[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    operations.append(self._queue.get(timeout=remaining))
+                else:
+                    operations.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return operations
+
+    def _run(self) -> None:
+        connection = sqlite3.connect(self.path)
+        while True:
+            operations = self._next_batch()
+            stop = operations[-1] is None
+            operations = [operation for operation in operations if operation]
+
+            with self._disk_lock:
+                try:
+                    with connection:
+                        for _, kind, payload in operations:
+                            if kind == "append":
+                                connection.executemany(
+                                    "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                                    payload,
+                                )
+                            else:
+                                connection.execute(
+                                    "DELETE FROM messages WHERE session_id = ?",
+                                    (payload,),
+                                )
+                except sqlite3.Error as e:
+                    l.error(f"Error writing {len(operations)} history operations: {e}")
+                if operations:
+                    self._mark_written(operations[-1][0])
+
+            if stop:
+                connection.close()
+                return
+
+    def _mark_written(self, seq: int) -> None:
+        with self._pending_changed:
+            for session_id in list(self._pending):
+                pending = self._pending[session_id]
+                if pending.cleared_seq is not None and pending.cleared_seq <= seq:
+                    pending.cleared_seq = None
+                while pending.messages and pending.messages[0][0] <= seq:
+                    pending.messages.popleft()
+                if pending.cleared_seq is None and not pending.messages:
+                    del self._pending[session_id]
+            self._written_seq = seq
+            self._pending_changed.notify_all()
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    Chat message history of a single session persisted in a `SQLiteHistoryStore`.
+
+    Attributes:
+        store (SQLiteHistoryStore): The store where messages are persisted.
+        session_id (str): The session ID of the conversation.
+        max_messages (int): The maximum number of recent messages kept and loaded.
+        shared (bool): Whether other processes write to the session, so it is never served from memory.
+    """
+
+    def __init__(
+        self,
+        store: SQLiteHistoryStore,
+        session_id: str,
+        max_messages: int,
+        shared: bool = False,
+    ):
+        self.store = store
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.shared = shared
+        self._messages: Optional[deque[BaseMessage]] = None
+
+    def _load(self) -> deque[BaseMessage]:
+        if self._messages is None or self.shared:
+            self._messages = deque(
+                self.store.load_recent(self.session_id, self.max_messages),
+                maxlen=self.max_messages,
+            )
+        return self._messages
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        return list(self._load())
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._load().extend(messages)
+        self.store.append(self.session_id, messages)
+        if self.shared:
+            # The next message of the session may be served by another process
+            self.store.flush()
+
+    def clear(self) -> None:
+        self._messages = deque(maxlen=self.max_messages)
+        self.store.clear(self.session_id)
@@ -0,0 +1,11 @@
+# src/metrics/__init__.py
+
+from .tracing import (  # noqa: F401
+    MetricsCallbackHandler,
+    RequestTrace,
+    current_trace,
+    finish_trace,
+    record_span,
+    span,
+    start_trace,
+)
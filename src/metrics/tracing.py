@@ -0,0 +1,303 @@
+"""
+Module Overview
+---------------
+This module provides the per-request tracing of the application and its Prometheus metrics.
+Every request gets a trace, held in a context variable so it follows the request into the agent, its callbacks and the
+threads running the SQL tool. The stages of the request record spans into the trace and into a Prometheus histogram:
+the prompt building, the LLM calls, the tool calls, and inside the SQL tool the query rewriting, the query execution
+and the null value replacement, as well as the history lookup and the fast path. A LangChain callback handler records
+the spans of the agent along with its token counts, iterations and tool calls.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Metrics: The Prometheus histograms and counters.
+- Classes: The trace of a request and the LangChain callback handler.
+- Functions: Functions to start a trace, record a span and close a trace.
+
+Example usage:
+    from src.metrics.tracing import MetricsCallbackHandler, finish_trace, span, start_trace
+
+    trace = start_trace()
+    with span("history"):
+        history = memory.get(session_id)
+    agent.invoke(inputs, {"callbacks": [MetricsCallbackHandler()]})
+    finish_trace(trace, endpoint="/generate", status=200)
+
+    trace.server_timing()
+    # Output: 'history;dur=0.1, prompt;dur=0.4, llm;dur=812.3, tool;dur=3.2, sql_execute;dur=1.9, total;dur=830.5'
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import Counter, Histogram
+
+__all__ = [
+    "MetricsCallbackHandler",
+    "RequestTrace",
+    "current_trace",
+    "finish_trace",
+    "record_span",
+    "span",
+    "start_trace",
+]
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+REQUEST_SECONDS = Histogram(
+    "agent_request_seconds",
+    "Duration of the API requests.",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "agent_stage_seconds",
+    "Duration of the stages of a request, summed per stage and request.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS = Counter(
+    "agent_llm_tokens", "Tokens sent to and generated by the LLM.", ["kind"]
+)
+LLM_CALLS = Histogram(
+    "agent_llm_calls_per_request",
+    "LLM calls per request, i.e. agent iterations.",
+    buckets=(0, 1, 2, 3, 4, 5, 10),
+)
+TOOL_CALLS = Counter(
+    "agent_tool_calls", "Tool calls, per tool and outcome.", ["tool", "outcome"]
+)
+TOOL_CALLS_PER_REQUEST = Histogram(
+    "agent_tool_calls_per_request",
+    "Tool calls per request.",
+    buckets=(0, 1, 2, 3, 4, 5, 10),
+)
+
+
+class RequestTrace:
+    """
+    The timings and counters of a single request.
+
+    Attributes:
+        start (float): The `time.perf_counter()` value at the start of the request.
+        spans (dict[str, float]): The seconds spent in each stage, summed over the spans of the stage.
+        llm_calls (int): The number of LLM calls, i.e. agent iterations.
+        tool_calls (int): The number of tool calls.
+        prompt_tokens (int): The tokens sent to the LLM.
+        completion_tokens (int): The tokens generated by the LLM.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: dict[str, float] = {}
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Returns the spans in the format of the Server-Timing header, in milliseconds.
+        """
+        with self._lock:
+            entries = [
+                f"{stage};dur={seconds * 1000:.1f}"
+                for stage, seconds in self.spans.items()
+            ]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def start_trace() -> RequestTrace:
+    """
+    Starts the trace of a request in the current context.
+
+    Returns:
+        RequestTrace: The trace of the request.
+    """
+    trace = RequestTrace()
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: RequestTrace, endpoint: str, status: int) -> None:
+    """
+    Records the totals of a finished request into the Prometheus metrics.
+
+    Args:
+        trace (RequestTrace): The trace of the request.
+        endpoint (str): The path of the endpoint.
+        status (int): The HTTP status code of the response.
+    """
+    REQUEST_SECONDS.labels(endpoint, str(status)).observe(trace.elapsed())
+    for stage, seconds in trace.spans.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    if trace.llm_calls or trace.tool_calls:
+        LLM_CALLS.observe(trace.llm_calls)
+        TOOL_CALLS_PER_REQUEST.observe(trace.tool_calls)
+
+
+def record_span(stage: str, seconds: float) -> None:
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, seconds)
+    else:
+        # Outside of a request, e.g. while benchmarking, the span is recorded on its own
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Records the time spent in the block as a span of the current request.
+
+    Args:
+        stage (str): The name of the stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler recording the spans of the prompt building, the LLM calls and the tool calls, the
+    token counts and the tool calls of the agent into the trace of the current request.
+    """
+
+    # Called on the event loop rather than in a thread, so the context of the request is the current one
+    run_inline = True
+
+    def __init__(self):
+        self._starts: dict[UUID, tuple[str, float]] = {}
+        self._tools: dict[UUID, str] = {}
+
+    def _start(self, run_id: UUID, stage: str) -> None:
+        self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> Optional[str]:
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return None
+        stage, start = started
+        record_span(stage, time.perf_counter() - start)
+        return stage
+
+    def on_chain_start(
+        self, serialized: dict, inputs: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if kwargs.get("name") == "ChatPromptTemplate":
+            self._start(run_id, "prompt")
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id)
+
+    def on_chat_model_start(
+        self, serialized: dict, messages: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._start(run_id, "llm")
+
+    def on_llm_start(
+        self, serialized: dict, prompts: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+        prompt_tokens, completion_tokens = token_usage(response)
+        TOKENS.labels("prompt").inc(prompt_tokens)
+        TOKENS.labels("completion").inc(completion_tokens)
+
+        trace = current_trace.get()
+        if trace is not None:
+            with trace._lock:
+                trace.llm_calls += 1
+                trace.prompt_tokens += prompt_tokens
+                trace.completion_tokens += completion_tokens
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id)
+
+    def on_tool_start(
+        self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._start(run_id, "tool")
+        self._tools[run_id] = (serialized or {}).get("name") or "unknown"
+        trace = current_trace.get()
+        if trace is not None:
+            with trace._lock:
+                trace.tool_calls += 1
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+        TOOL_CALLS.labels(self._tools.pop(run_id, "unknown"), "success").inc()
+
+    def on_tool_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id)
+        TOOL_CALLS.labels(self._tools.pop(run_id, "unknown"), "error").inc()
+
+
+def token_usage(response: LLMResult) -> tuple[int, int]:
+    """
+    Reads the prompt and completion tokens of an LLM call, from the usage of the messages or of the whole call.
+    """
+    prompt_tokens, completion_tokens = 0, 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if prompt_tokens or completion_tokens:
+        return prompt_tokens, completion_tokens
+
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
@@ -2,5 +2,6 @@
 
 from .agent_description_prompt import get_agent_description_prompt  # noqa: F401
 from .few_shot_queries_prompt import get_few_shot_queries_prompt  # noqa: F401
+from .schema_prompt import SchemaPromptCompiler  # noqa: F401
 from .sql_tool_rules_prompt import get_sql_tool_rules_prompt  # noqa: F401
 from .tools_prompt import get_tools_prompt  # noqa: F401
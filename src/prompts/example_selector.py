@@ -0,0 +1,205 @@
+"""
+Module Overview
+---------------
+This module provides the example selector of the few-shot prompt, backed by an embedding index persisted on disk.
+The vectors of the curated examples are computed once, normalized and saved as a NumPy file next to a JSON manifest
+holding the examples and a fingerprint of the examples and the embedding model. At startup the vectors are memory
+mapped instead of recomputed, so no embedding call is made unless the examples or the model changed. Selecting the
+examples of a question is a single matrix-vector product over the mapped vectors, and the question embeddings are
+cached in memory.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: A function to fingerprint the examples and the embedding model.
+- Classes: The example selector, implementing LangChain's `BaseExampleSelector`.
+
+Example usage:
+    from langchain_openai import OpenAIEmbeddings
+
+    from src.prompts.example_selector import PersistedExampleSelector
+    from src.prompts.few_shot_queries_prompt import get_examples
+
+    selector = PersistedExampleSelector.load_or_build(
+        get_examples(),
+        OpenAIEmbeddings(model="text-embedding-ada-002"),
+        index_dir="data/few_shot_index",
+        model_name="text-embedding-ada-002",
+        k=5,
+    )
+
+    examples = selector.select_examples({"input": "Which clients hold TSLA?"})
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.example_selectors import BaseExampleSelector
+
+from src.logger.logger import l
+
+__all__ = ["PersistedExampleSelector"]
+
+VECTORS_FILE = "vectors.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+def examples_fingerprint(examples: list[dict], model_name: str) -> str:
+    payload = json.dumps({"model": model_name, "examples": examples}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PersistedExampleSelector(BaseExampleSelector):
+    """
+    Selects the examples most similar to the input, from example vectors persisted on disk.
+
+    Attributes:
+        examples (list[dict]): The examples, in the order of their vectors.
+        vectors (np.ndarray): The unit-length example vectors, one row per example.
+        embeddings (Embeddings): The embedding model of the questions, the same one the examples were embedded with.
+        k (int): The number of examples selected.
+        input_keys (list[str]): The input variables embedded to select the examples, all of them if None.
+        index_dir (str): The folder the index is persisted in, None keeps it in memory only.
+        model_name (str): The name of the embedding model, part of the fingerprint of the index.
+    """
+
+    def __init__(
+        self,
+        examples: list[dict],
+        vectors: np.ndarray,
+        embeddings: Embeddings,
+        k: int = 4,
+        input_keys: Optional[list[str]] = None,
+        index_dir: Optional[str] = None,
+        model_name: str = "",
+    ):
+        self.examples = examples
+        self.vectors = vectors
+        self.embeddings = embeddings
+        self.k = k
+        self.input_keys = input_keys
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load_or_build(
+        cls,
+        examples: list[dict],
+        embeddings: Embeddings,
+        index_dir: str,
+        model_name: str,
+        k: int = 4,
+        input_keys: Optional[list[str]] = None,
+    ) -> "PersistedExampleSelector":
+        """
+        Loads the persisted index of the examples, or embeds the examples and persists them if the index is stale.
+
+        Args:
+            examples (list[dict]): The curated examples.
+            embeddings (Embeddings): The embedding model.
+            index_dir (str): The folder the index is persisted in.
+            model_name (str): The name of the embedding model, a different model invalidates the index.
+            k (int): The number of examples selected.
+            input_keys (list[str]): The input variables embedded to select the examples, all of them if None.
+
+        Returns:
+            PersistedExampleSelector: The example selector.
+        """
+        fingerprint = examples_fingerprint(examples, model_name)
+        selector = cls(examples, None, embeddings, k, input_keys, index_dir, model_name)
+
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        try:
+            with open(manifest_path, encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest.get("fingerprint") == fingerprint:
+                selector.vectors = np.load(vectors_path, mmap_mode="r")
+                l.info(
+                    f"Loaded {len(examples)} few-shot example vectors from {index_dir}"
+                )
+                return selector
+        except (OSError, ValueError):
+            pass
+
+        l.info(f"Embedding {len(examples)} few-shot examples into {index_dir}")
+        selector.vectors = selector._embed_examples(examples)
+        selector._save()
+        return selector
+
+    def _example_text(self, example: dict) -> str:
+        keys = self.input_keys or sorted(example)
+        return " ".join(str(example[key]) for key in keys)
+
+    def _embed_examples(self, examples: list[dict]) -> np.ndarray:
+        vectors = np.asarray(
+            self.embeddings.embed_documents([self._example_text(e) for e in examples]),
+            dtype=np.float32,
+        ).reshape(len(examples), -1)
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+    def _save(self) -> None:
+        if self.index_dir is None:
+            return
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        fingerprint = examples_fingerprint(self.examples, self.model_name)
+        # Written to temporary files then renamed, so a concurrent reader never sees a partial index
+        vectors_tmp = os.path.join(self.index_dir, f".{os.getpid()}.{VECTORS_FILE}")
+        manifest_tmp = os.path.join(self.index_dir, f".{os.getpid()}.{MANIFEST_FILE}")
+        np.save(vectors_tmp, np.ascontiguousarray(self.vectors))
+        with open(manifest_tmp, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "fingerprint": fingerprint,
+                    "model": self.model_name,
+                    "examples": self.examples,
+                },
+                file,
+            )
+        os.replace(vectors_tmp, os.path.join(self.index_dir, VECTORS_FILE))
+        os.replace(manifest_tmp, os.path.join(self.index_dir, MANIFEST_FILE))
+
+    def add_example(self, example: dict) -> None:
+        """
+        Embeds a new example and persists the grown index.
+
+        Args:
+            example (dict): The example, with the same keys as the other examples.
+        """
+        vector = self._embed_examples([example])
+        with self._lock:
+            self.examples = [*self.examples, example]
+            self.vectors = np.concatenate([self.vectors, vector])
+            self._save()
+
+    def select_examples(self, input_variables: dict) -> list[dict]:
+        """
+        Selects the examples most similar to the input, the most similar first.
+
+        Args:
+            input_variables (dict): The input variables of the prompt.
+
+        Returns:
+            list[dict]: The selected examples.
+        """
+        query = np.asarray(
+            self.embeddings.embed_query(self._example_text(input_variables)),
+            dtype=np.float32,
+        )
+        with self._lock:
+            examples, vectors = self.examples, self.vectors
+
+        similarities = vectors @ query
+        k = min(self.k, len(examples))
+        if k == 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [examples[i] for i in top]
@@ -2,12 +2,15 @@
 Module Overview
 ---------------
 This module provides a function to generate a few-shot prompt template for generating SQL queries based on user inputs.
-It uses LangChain's FewShotPromptTemplate, example selectors, and OpenAI embeddings to construct the prompt.
+It uses LangChain's FewShotPromptTemplate and an example selector backed by a persisted embedding index to construct
+the prompt. The examples are embedded with OpenAI embeddings, or with a local sentence-transformers model when
+`FEW_SHOT_EMBEDDINGS=local`, only when the examples or the model change.
 
 Structure
 ---------
 - Imports: Necessary libraries and modules.
 - Function: A function to generate and return a few-shot prompt template for SQL queries.
+- Example Selector: A function to load the example selector, built once per process.
 - Example Queries: A function to provide example input-query pairs.
 
 Example usage:
@@ -19,11 +22,22 @@ Note:
     The `get_few_shot_queries_prompt` function should be called to retrieve the prompt template for use in the application.
 """
 
-from langchain_community.vectorstores import FAISS
-from langchain_core.example_selectors import SemanticSimilarityExampleSelector
+import os
+from functools import lru_cache
+
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_openai import OpenAIEmbeddings
 
+from src.cache.embeddings import LRUCachedEmbeddings
+from src.config import (
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    FEW_SHOT_EMBEDDINGS,
+    FEW_SHOT_INDEX_DIR,
+    FEW_SHOT_LOCAL_MODEL,
+)
+from src.prompts.example_selector import PersistedExampleSelector
+
 __all__ = ["get_few_shot_queries_prompt"]
 
 
@@ -91,16 +105,8 @@ def get_few_shot_queries_prompt():
         top_k=3
     )
 
-    example_selector = SemanticSimilarityExampleSelector.from_examples(
-        get_examples(),
-        OpenAIEmbeddings(model="text-embedding-ada-002"),
-        FAISS,
-        k=5,
-        input_keys=["input"],
-    )
-
     return FewShotPromptTemplate(
-        example_selector=example_selector,
+        example_selector=get_example_selector(),
         example_prompt=PromptTemplate.from_template(
             "User input: {input}\nSQL query: {query}"
         ),
@@ -108,3 +114,27 @@ def get_few_shot_queries_prompt():
         prefix=system_few_shot_prefix,
         suffix="",
     )
+
+
+def get_example_embeddings() -> tuple[Embeddings, str]:
+    if FEW_SHOT_EMBEDDINGS == "local":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        return (
+            HuggingFaceEmbeddings(model_name=FEW_SHOT_LOCAL_MODEL),
+            FEW_SHOT_LOCAL_MODEL,
+        )
+    return OpenAIEmbeddings(model="text-embedding-ada-002"), "text-embedding-ada-002"
+
+
+@lru_cache(maxsize=None)
+def get_example_selector() -> PersistedExampleSelector:
+    embeddings, model_name = get_example_embeddings()
+    return PersistedExampleSelector.load_or_build(
+        get_examples(),
+        LRUCachedEmbeddings(embeddings, max_entries=EMBEDDING_CACHE_MAX_ENTRIES),
+        index_dir=os.path.join(FEW_SHOT_INDEX_DIR, model_name.replace("/", "__")),
+        model_name=model_name,
+        k=5,
+        input_keys=["input"],
+    )
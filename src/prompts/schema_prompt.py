@@ -0,0 +1,261 @@
+"""
+Module Overview
+---------------
+This module provides the compiler of the schema section of the system prompt.
+The schema is read from the live tables instead of being written by hand, so the prompt follows the data: every column
+with its type, the full list of values of the low-cardinality text columns, the most frequent values of the other
+text columns and the range of the numeric and date columns. The section is rendered in a compact one-line-per-column
+format and fitted into a token budget by dropping the least useful details first. The rendered section is cached
+until the schema version of the database changes, i.e. until a table is rebuilt by the ingest.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Descriptions: Short descriptions of the tables and notes on the columns whose meaning is not obvious from the name.
+- Data Models: The statistics of a column.
+- Classes: The schema prompt compiler.
+
+Example usage:
+    from src.prompts.schema_prompt import SchemaPromptCompiler
+    from src.tools.sql import execute, get_tables_columns
+
+    compiler = SchemaPromptCompiler(execute, get_tables_columns, token_budget=800)
+
+    compiler.render()
+    # Output: 'Table allocations: client investment portfolios, ...\n- "Client" TEXT, e.g. Client_15, ...'
+"""
+
+import threading
+from typing import Callable, NamedTuple, Optional
+
+import tiktoken
+
+from src.logger.logger import l
+
+__all__ = ["ColumnStats", "SchemaPromptCompiler"]
+
+TABLE_DESCRIPTIONS = {
+    "allocations": "client investment portfolios, the target allocation of each asset class in the target portfolio of each client",
+    "advisors_clients": "assets held by each client with their prices, market value and analyst data",
+}
+
+# Rough number of characters per token, used when the tokenizer can not be loaded
+CHARS_PER_TOKEN = 4
+
+COLUMN_NOTES = {
+    ("allocations", "Target Allocation (%)"): "percentage",
+    ("advisors_clients", "Market Value"): "Quantity * Current Price",
+    ("advisors_clients", "Dividend Yield"): "percentage",
+    ("advisors_clients", "Purchase Date"): "YYYY-MM-DD",
+}
+
+
+class ColumnStats(NamedTuple):
+    """
+    The statistics of a column rendered in the schema section.
+
+    Attributes:
+        name (str): The name of the column.
+        type (str): The declared type of the column.
+        distinct (int): The number of distinct non-null values.
+        nullable (bool): Whether the column contains nulls.
+        values (tuple): Every distinct value of a low-cardinality text column, else its most frequent values.
+        minimum (object): The smallest value of a numeric or date column.
+        maximum (object): The largest value of a numeric or date column.
+    """
+
+    name: str
+    type: str
+    distinct: int
+    nullable: bool
+    values: tuple
+    minimum: object
+    maximum: object
+
+
+def load_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encodings are downloaded on first use, an offline host estimates the tokens from the length instead
+        l.warning(f"Unable to load the tokenizer of {model}, estimating tokens: {e}")
+        return None
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SchemaPromptCompiler:
+    """
+    Builds the schema section of the system prompt from the live tables, within a token budget.
+
+    Attributes:
+        execute (Callable[[str], tuple[list[str], list[tuple]]]): Runs a read-only query on the SQLite database.
+        get_tables_columns (Callable[[], dict[str, list[str]]]): Returns the columns of each table.
+        token_budget (int): The maximum number of tokens of the rendered section.
+        max_distinct_values (int): Text columns with at most this many distinct values have all their values listed.
+        sample_values (int): The number of most frequent values listed for the other text columns.
+        model (str): The model whose tokenizer counts the tokens.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[str], tuple[list[str], list[tuple]]],
+        get_tables_columns: Callable[[], dict[str, list[str]]],
+        token_budget: int = 800,
+        max_distinct_values: int = 16,
+        sample_values: int = 3,
+        model: str = "gpt-4o",
+        table_descriptions: Optional[dict[str, str]] = None,
+        column_notes: Optional[dict[tuple[str, str], str]] = None,
+    ):
+        self.execute = execute
+        self.get_tables_columns = get_tables_columns
+        self.token_budget = token_budget
+        self.max_distinct_values = max_distinct_values
+        self.sample_values = sample_values
+        self.model = model
+        self.table_descriptions = (
+            TABLE_DESCRIPTIONS if table_descriptions is None else table_descriptions
+        )
+        self.column_notes = COLUMN_NOTES if column_notes is None else column_notes
+        self._encoding = load_encoding(model)
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._rendered = ""
+
+    def fingerprint(self) -> int:
+        """
+        Returns the version of the schema, which changes whenever a table is created, dropped or rebuilt.
+        """
+        _, rows = self.execute("PRAGMA schema_version")
+        return rows[0][0]
+
+    def render(self) -> str:
+        """
+        Returns the schema section, rebuilt only when the schema changed since the last call.
+
+        Returns:
+            str: The schema section of the system prompt.
+        """
+        fingerprint = self.fingerprint()
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._rendered = self.compile()
+                self._fingerprint = fingerprint
+                l.info(
+                    f"Compiled the schema prompt into {self.count_tokens(self._rendered)} tokens"
+                )
+            return self._rendered
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(self._encoding.encode(text))
+
+    def truncate(self, text: str) -> str:
+        if self._encoding is None:
+            return text[: self.token_budget * CHARS_PER_TOKEN]
+        return self._encoding.decode(self._encoding.encode(text)[: self.token_budget])
+
+    def compile(self) -> str:
+        """
+        Reads the statistics of the tables and renders them with as much detail as the token budget allows.
+
+        Returns:
+            str: The schema section of the system prompt.
+        """
+        tables = {
+            table: self.column_stats(table, columns)
+            for table, columns in self.get_tables_columns().items()
+        }
+
+        # From the most to the least detailed, the first one within the budget is used
+        for detail in range(3, -1, -1):
+            text = self.format(tables, detail)
+            if self.count_tokens(text) <= self.token_budget:
+                return text
+
+        l.warning(
+            f"The schema prompt does not fit in {self.token_budget} tokens, it is truncated"
+        )
+        return self.truncate(text)
+
+    def column_stats(self, table: str, columns: list[str]) -> list[ColumnStats]:
+        _, types = self.execute(
+            f"SELECT name, type FROM pragma_table_info('{table.replace(chr(39), chr(39) * 2)}')"
+        )
+        types = dict(types)
+
+        # A single scan of the table for the counts and ranges of every column
+        aggregates = ", ".join(
+            f"COUNT(DISTINCT {quote(c)}), COUNT(*) - COUNT({quote(c)}), MIN({quote(c)}), MAX({quote(c)})"
+            for c in columns
+        )
+        _, rows = self.execute(f"SELECT {aggregates} FROM {quote(table)}")
+        row = rows[0]
+
+        stats = []
+        for index, column in enumerate(columns):
+            distinct, nulls, minimum, maximum = row[4 * index : 4 * index + 4]
+            column_type = (types.get(column) or "").upper()
+            values = ()
+            if column_type in ("TEXT", ""):
+                limit = (
+                    self.max_distinct_values
+                    if distinct <= self.max_distinct_values
+                    else self.sample_values
+                )
+                # Most frequent first, so the samples are never a rare misspelling
+                _, value_rows = self.execute(
+                    f"SELECT {quote(column)} FROM {quote(table)} WHERE {quote(column)} IS NOT NULL "
+                    f"GROUP BY 1 ORDER BY COUNT(*) DESC, 1 LIMIT {limit}"
+                )
+                values = tuple(value_row[0] for value_row in value_rows)
+            stats.append(
+                ColumnStats(
+                    column, column_type, distinct, nulls > 0, values, minimum, maximum
+                )
+            )
+        return stats
+
+    def format(self, tables: dict[str, list[ColumnStats]], detail: int) -> str:
+        """
+        Renders the schema section.
+
+        Args:
+            tables (dict[str, list[ColumnStats]]): The statistics of the columns of each table.
+            detail (int): 3 renders everything, 2 drops the most frequent values of the high-cardinality columns,
+                1 drops the value lists and the ranges, 0 also drops the descriptions and the notes.
+
+        Returns:
+            str: The schema section.
+        """
+        lines = []
+        for table, columns in tables.items():
+            description = self.table_descriptions.get(table)
+            lines.append(
+                f"Table {table}: {description}"
+                if description and detail > 0
+                else f"Table {table}:"
+            )
+            for column in columns:
+                line = f"- {quote(column.name)} {column.type or 'TEXT'}"
+                note = self.column_notes.get((table, column.name))
+                if note and detail > 0:
+                    line += f" ({note})"
+                if detail > 1 and column.values:
+                    listed = ", ".join(str(value) for value in column.values)
+                    if column.distinct <= self.max_distinct_values:
+                        line += f", one of: {listed}"
+                    elif detail > 2:
+                        line += f", e.g. {listed}"
+                elif detail > 1 and column.minimum is not None:
+                    line += f", {column.minimum} to {column.maximum}"
+                if column.nullable:
+                    line += ", nullable"
+                lines.append(line)
+        return "\n".join(lines)
@@ -3,6 +3,8 @@ Module Overview
 ---------------
 This module provides a function to generate a system prompt template containing rules for using the SQL tool.
 The prompt guides the user on how to interact with the SQL database, including proper syntax and constraints.
+The schema of the tables is not written here, it is compiled from the live tables into the `{schema}` variable
+(see `src/prompts/schema_prompt.py`).
 
 Structure
 ---------
@@ -25,64 +27,24 @@ __all__ = ["get_sql_tool_rules_prompt"]
 def get_sql_tool_rules_prompt():
     return """\
     The SQL tool enables interaction with a SQL Database. You can query the database schema, the columns, and values. The tool
-    will return either a string containing the rows of the query or an empty string if there's no result for the query, act accordingly.
+    returns the number of rows, then the columns having the same value on every row as `Column: value (every row)`, then a header
+    line and one line per row, with the values separated by tabs. Identical rows are given once, with their number in a `(count)` column.
+    A result too long to list is summarized with the range or the most frequent values of each column. If there's no result for the
+    query, the tool says so, act accordingly.
     The database you have access to is information about the clients for a Financial Advisor.
     
-    Here's a brief overview of the tables in the database:
+    Here's the schema of the database, with the values or the range of values of each column:
     
-    allocations: This table represent client investment portfolios, detailing the allocation of various asset classes within different target portfolios for each client.
-    Columns:
-    - Client: This column contains the identifier for each client.
-    - Target Portfolio: This column specifies the type of investment portfolio targeted for each client.
-    - Asset Class: This column indicates the type of asset class within the client's portfolio.
-    - Target Allocation (%): This column represents the target allocation percentage of the specified asset class within the client's portfolio.
-
-    Summary:
-    advisors_clients: This table contains data regarding the financial portfolio performance of various client's assets. It includes details such as the asset symbol, name, sector, quantity, prices, market value, purchase date, dividend yield, P/E ratio, 52-week high and low, analyst rating, target price, and risk level.
-
-    Column Descriptions:
-    1. Client: The identifier for the client who owns the asset.
-    2. Symbol: The ticker symbol of the asset.
-    3. Name: The name of the asset or company.
-    4. Sector: The sector to which the asset belongs.
-    5. Quantity: The number of units of the asset held.
-    6. Buy Price: The purchase price per unit of the asset.
-    7. Current Price: The current market price per unit of the asset.
-    8. Market Value: The total market value of the asset holdings (Quantity * Current Price).
-    9. Purchase Date: The date when the asset was purchased.
-    10. Dividend Yield: The dividend yield of the asset expressed as a percentage.
-    11. P/E Ratio: The price-to-earnings ratio of the asset.
-    12. 52-Week High: The highest price of the asset in the past 52 weeks.
-    13. 52-Week Low: The lowest price of the asset in the past 52 weeks.
-    14. Analyst Rating: The current rating given by analysts (e.g., Buy, Hold, Sell).
-    15. Target Price: The price target set by analysts.
-    16. Risk Level: The risk level associated with the asset (e.g., Low, Medium, High).
-
-    Summary:
-    The table provides a comprehensive overview of clients' financial portfolios, highlighting key metrics such as asset symbols, names, sectors, quantities, prices, market values, purchase dates, dividend yields, P/E ratios, 52-week highs and lows, analyst ratings, target prices, and risk levels. This data can be used to analyze the performance and risk profile of the assets held by each client.
-    
-    About the values in the database:
-    
-    The possible values for columns in table "allocations":
-    - The possible values for the column "Target Portfolio" are: Balanced, Growth, Aggressive Growth, Conservative, and Null.
-    - The possible values for the column "Asset Class" are: Stocks, Bonds, ETFs, Cash, and Null.
-    - The possible values for the column "Client" are: Either Client_[client_number] i.e. Client_1, or Null.
-    - The possible values for the column "Target Allocation (%)" are: Any positive real number between 0 and 100.
-
-    The possible values for columns in table "advisors_clients":
-    - The possible values for the column "Client" are: Either Client_[client_number] i.e. Client_1, or Null.
-    - The possible values for the column "Sector" are: ETF, Communication Services, Technology, Consumer Discretionary, Consumer Staples, Health Care, Financials, or Null.
-    - The possible values for the column "Analyst Rating" are: Hold, Buy, Sell, or Null.
-    - The possible values for the column "Risk Level" are: High, Medium, Low, or Null.
-    - The possible value for the columns that contain a number are: Any positive real number.
+    {schema}
     
     When using this tool, you must:
     - Always use correct SQL syntax. 
     - Always put column and table names around `` since it's possible for them to have spaces or special characters.
     - Always query the tables and columns mentioned above and no other.
     - Never make DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database. Only SELECT statements are allowed.
-    - Always correct the user message if needed. Examaple: If the user asks for ETFs, that's not a value of Asset Class column, but ETF is.
+    - Always correct the user message if needed, using the values listed in the schema. Example: If the user asks for ETF allocations, the value of the Asset Class column is ETFs.
     - Never use the wildcard `*` in the generated query, instead always specify the columns you want to retrieve.
     - Never make the same query twice in a row, if the first one didn't give you meaningful results, try another one.
+    - Prefer filtering and aggregating in SQL over fetching many rows. Long results are cut in pages: only call the tool again with the page_token given at the end of a result if the answer needs the next rows.
     - Always answer only what the user asked for, don't provide additional information, only if asked for.
     """
@@ -0,0 +1,3 @@
+# src/router/__init__.py
+
+from .fast_path import FastPathRouter, Intent, get_intents  # noqa: F401
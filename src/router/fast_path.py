@@ -0,0 +1,258 @@
+"""
+Module Overview
+---------------
+This module provides a deterministic fast path that answers known question shapes without calling the LLM.
+A large share of the traffic has the same shape as the canned examples of the few-shot prompt, e.g. "target allocation
+of X for client Y" or "which clients hold Z". The router recognizes these parameterized intents with patterns, runs
+their SQL through the SQL tool pipeline, and formats the answer from the rows. On a miss, including a matching
+question whose query returns nothing, the caller falls back to the full agent. Hit and miss counters are kept per
+intent.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: Functions to normalize the captured parameters and format values.
+- Intents: The known question shapes, their SQL and their answer templates.
+- Classes: The router.
+
+Example usage:
+    from src.router.fast_path import FastPathRouter, get_intents
+    from src.tools.sql import run_query
+
+    router = FastPathRouter(get_intents(), run_query)
+
+    answer = router.route("What is the target allocation of stocks for Client_1?")
+    # Output: 'The target allocation of Stocks for Client_1 is 50%.' or None on a miss
+"""
+
+import re
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+from src.logger.logger import l
+
+__all__ = ["FastPathRouter", "Intent", "get_intents"]
+
+CLIENT = r"(?P<client>client[ _]?\d+)"
+ASSET_CLASS = r"(?P<asset_class>stocks?|bonds?|etfs?|cash)"
+ASSET = r"(?P<asset>[\w.&-]+)"
+
+ASSET_CLASSES = {"stock": "Stocks", "bond": "Bonds", "etf": "ETFs", "cash": "Cash"}
+
+
+def normalize_client(client: str) -> str:
+    return "Client_" + re.sub(r"\D", "", client)
+
+
+def normalize_asset_class(asset_class: str) -> str:
+    return ASSET_CLASSES[asset_class.lower().rstrip("s")]
+
+
+def sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def escape_like(value: str) -> str:
+    # The value is matched as is in a LIKE pattern escaped with a backslash
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+def word_pattern(word: str) -> str:
+    # Matches a whole word of a text padded with spaces, e.g. "amazon" in " amazon com inc  "
+    return sql_literal(f"% {escape_like(word.lower())} %")
+
+
+def format_holders(p: dict, rows: list[list]) -> Optional[str]:
+    # Several assets match, e.g. "spdr", the question is left to the agent
+    names = {row[2] for row in rows if row[2]}
+    symbols = {row[1] for row in rows if row[1]}
+    if len(names) > 1 or len(symbols) > 1:
+        return None
+    clients = dict.fromkeys(row[0] for row in rows)
+    return f"The clients holding {p['asset']} are: " + ", ".join(clients) + "."
+
+
+def format_number(value: Any) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class Intent(NamedTuple):
+    """
+    A known question shape.
+
+    Attributes:
+        name (str): The name of the intent, used in the metrics.
+        pattern (re.Pattern): The pattern a question must fully match, its named groups are the parameters.
+        build_query (Callable[[dict], str]): Builds the SQL query from the parameters.
+        format_answer (Callable[[dict, list[list]], Optional[str]]): Formats the answer from the parameters and the
+            rows, None if the rows do not answer the question unambiguously.
+    """
+
+    name: str
+    pattern: re.Pattern
+    build_query: Callable[[dict], str]
+    format_answer: Callable[[dict, list[list]], Optional[str]]
+
+
+def get_intents() -> list[Intent]:
+    return [
+        Intent(
+            name="asset_class_allocation",
+            pattern=re.compile(
+                rf"(?:what is |what's |show )?(?:me )?(?:the )?target allocation(?: percentage)? "
+                rf"(?:of|for|in) {ASSET_CLASS} (?:for|of) {CLIENT}\??",
+                re.IGNORECASE,
+            ),
+            build_query=lambda p: (
+                'SELECT DISTINCT "Target Allocation (%)" FROM allocations '
+                f'WHERE "Client" = {sql_literal(normalize_client(p["client"]))} '
+                f'AND "Asset Class" = {sql_literal(normalize_asset_class(p["asset_class"]))};'
+            ),
+            format_answer=lambda p, rows: (
+                f"The target allocation of {normalize_asset_class(p['asset_class'])} "
+                f"for {normalize_client(p['client'])} is "
+                + " and ".join(f"{format_number(row[0])}%" for row in rows)
+                + "."
+            ),
+        ),
+        Intent(
+            name="asset_class_allocation_per_client",
+            pattern=re.compile(
+                rf"(?:what is |what's |show )?(?:me )?(?:the )?target allocation(?: percentage)? "
+                rf"(?:of|for|in) {ASSET_CLASS} (?:for|of) (?:each|every|all) clients?\??",
+                re.IGNORECASE,
+            ),
+            build_query=lambda p: (
+                'SELECT DISTINCT "Client", "Target Allocation (%)" FROM allocations '
+                f'WHERE "Asset Class" = {sql_literal(normalize_asset_class(p["asset_class"]))} '
+                'ORDER BY "Client";'
+            ),
+            format_answer=lambda p, rows: (
+                f"The target allocation of {normalize_asset_class(p['asset_class'])} for each client is: "
+                + ", ".join(f"{row[0]}: {format_number(row[1])}%" for row in rows)
+                + "."
+            ),
+        ),
+        Intent(
+            name="client_allocations",
+            pattern=re.compile(
+                rf"(?:what are |show |list )(?:me )?(?:the |all )?(?:target )?allocations? (?:of|for) {CLIENT}\??",
+                re.IGNORECASE,
+            ),
+            build_query=lambda p: (
+                'SELECT DISTINCT "Asset Class", "Target Allocation (%)" FROM allocations '
+                f'WHERE "Client" = {sql_literal(normalize_client(p["client"]))};'
+            ),
+            format_answer=lambda p, rows: (
+                f"The target allocations for {normalize_client(p['client'])} are: "
+                + ", ".join(f"{row[0]}: {format_number(row[1])}%" for row in rows)
+                + "."
+            ),
+        ),
+        Intent(
+            name="target_portfolio",
+            pattern=re.compile(
+                rf"(?:what is |what's )(?:the )?target portfolio (?:of|for) {CLIENT}\??",
+                re.IGNORECASE,
+            ),
+            build_query=lambda p: (
+                'SELECT DISTINCT "Target Portfolio" FROM allocations '
+                f'WHERE "Client" = {sql_literal(normalize_client(p["client"]))};'
+            ),
+            format_answer=lambda p, rows: (
+                f"The target portfolio of {normalize_client(p['client'])} is "
+                + " and ".join(str(row[0]) for row in rows)
+                + "."
+            ),
+        ),
+        Intent(
+            name="asset_holders",
+            pattern=re.compile(
+                rf"which (?:of my )?clients (?:hold|have|own)(?: any)? {ASSET}(?: stocks?| shares)?\??",
+                re.IGNORECASE,
+            ),
+            build_query=lambda p: (
+                'SELECT DISTINCT "Client", "Symbol", "Name" FROM advisors_clients '
+                f'WHERE UPPER("Symbol") = {sql_literal(p["asset"].upper())} '
+                "OR ' ' || REPLACE(REPLACE(LOWER(\"Name\"), ',', ' '), '.', ' ') || ' ' "
+                f"LIKE {word_pattern(p['asset'])} ESCAPE '\\' "
+                'ORDER BY "Client";'
+            ),
+            format_answer=format_holders,
+        ),
+    ]
+
+
+class FastPathRouter:
+    """
+    Answers the questions matching a known intent without the LLM.
+
+    Attributes:
+        intents (list[Intent]): The known question shapes, tried in order.
+        run_query (Callable[[str], tuple[list[str], list[list]]]): Runs an SQL query and returns its columns and rows.
+    """
+
+    def __init__(
+        self,
+        intents: list[Intent],
+        run_query: Callable[[str], tuple[list[str], list[list]]],
+    ):
+        self.intents = intents
+        self.run_query = run_query
+        self.hits = {intent.name: 0 for intent in intents}
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def route(self, question: str) -> Optional[str]:
+        """
+        Answers a question if it matches a known intent.
+
+        Args:
+            question (str): The user's query.
+
+        Returns:
+            Optional[str]: The answer, None if the question must go to the agent.
+        """
+        for intent in self.intents:
+            match = intent.pattern.fullmatch(question.strip())
+            if match is None:
+                continue
+
+            parameters = match.groupdict()
+            try:
+                _, rows = self.run_query(intent.build_query(parameters))
+            except Exception as e:
+                l.warning(f"Fast path intent {intent.name} failed, falling back: {e}")
+                break
+            if not rows:
+                # The agent may still find an answer, e.g. by correcting a misspelled value
+                break
+
+            answer = intent.format_answer(parameters, rows)
+            if answer is None:
+                break
+
+            with self._lock:
+                self.hits[intent.name] += 1
+            l.info(f"Fast path answered with intent {intent.name}")
+            return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss counters of the router.
+
+        Returns:
+            dict: The hits per intent, the misses and the hit rate.
+        """
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + self.misses
+            return {
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
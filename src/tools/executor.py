@@ -0,0 +1,73 @@
+"""
+Module Overview
+---------------
+This module provides an agent executor running the tool calls of an agent step in parallel.
+With OpenAI tools, the model can ask for several tool calls in a single turn, e.g. one query on `allocations` and one
+on `advisors_clients`. The LangChain executor runs them one after the other when invoked synchronously, and all at
+once without any bound when invoked asynchronously. This executor runs them concurrently in both cases, on a bounded
+pool shared by every request of the worker, and returns their results in the order of the calls, so a step takes as
+long as its slowest call instead of the sum of all of them.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Pool: The thread pool and the slots bounding the tool calls in flight.
+- Classes: The parallel agent executor.
+
+Example usage:
+    from src.tools.executor import ParallelAgentExecutor
+
+    agent_executor = ParallelAgentExecutor(agent=react_agent, tools=tools, max_iterations=3)
+    response = agent_executor.invoke({"input": "Which clients hold Tesla stocks and what is their target portfolio?"})
+"""
+
+import asyncio
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Iterator, Union
+
+from langchain.agents.agent import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from src.config import TOOL_MAX_CONCURRENCY
+
+# Copies the context of the request into the threads, for the metrics and the log context
+tool_pool = ContextThreadPoolExecutor(
+    max_workers=TOOL_MAX_CONCURRENCY, thread_name_prefix="agent-tool"
+)
+tool_slots = asyncio.Semaphore(TOOL_MAX_CONCURRENCY)
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    Agent executor running the tool calls of a step concurrently, at most `TOOL_MAX_CONCURRENCY` per worker.
+    """
+
+    def _iter_next_step(
+        self, *args: Any, **kwargs: Any
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        # The base class yields the actions of the step, then the result of `_perform_agent_action` for each of them,
+        # which is deferred below, so the calls are only started once all of them are known
+        deferred_calls = []
+        for output in super()._iter_next_step(*args, **kwargs):
+            if isinstance(output, partial):
+                deferred_calls.append(output)
+            else:
+                yield output
+
+        if len(deferred_calls) == 1:
+            yield deferred_calls[0]()
+            return
+
+        futures: list[Future] = [tool_pool.submit(call) for call in deferred_calls]
+        for future in futures:
+            yield future.result()
+
+    def _perform_agent_action(self, *args: Any, **kwargs: Any) -> Any:
+        return partial(super()._perform_agent_action, *args, **kwargs)
+
+    async def _aperform_agent_action(self, *args: Any, **kwargs: Any) -> AgentStep:
+        # The base class already gathers the calls of a step, they only need a bound
+        async with tool_slots:
+            return await super()._aperform_agent_action(*args, **kwargs)
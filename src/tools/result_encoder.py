@@ -0,0 +1,188 @@
+"""
+Module Overview
+---------------
+This module encodes the results of the SQL tool into compact text for the LLM.
+A tool result is sent back to the model on every following iteration of the agent, so its size is paid again on each
+of them. A Python list of lists repeats quotes, brackets and commas on every cell and has no header. The encoder
+writes a header line and one tab separated line per row instead, gives the columns holding the same value on every
+row once above the table, merges duplicate rows into a count, and rounds floats. When the table still exceeds its
+token budget, it is replaced by a summary: the row count, the range of the numeric columns, the most frequent values
+of the other columns, and as many leading rows as fit. A page of a longer result is not summarized, since a summary
+would only cover the page, it is cut to the leading rows that fit instead, and the next page starts after them.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Helpers: Functions to format cells and estimate tokens.
+- Functions: The table encoding, the summary, and the fitting of a page into the budget.
+
+Example usage:
+    from src.tools.result_encoder import encode_result
+
+    encode_result(
+        ["Client", "Asset Class", "Target Allocation (%)"],
+        [["Client_1", "Stocks", 40.0], ["Client_2", "Stocks", 35.5], ["Client_2", "Stocks", 35.5]],
+    )
+    # Output:
+    # 3 rows
+    # Asset Class: Stocks (every row)
+    # Client	Target Allocation (%)	(count)
+    # Client_1	40	1
+    # Client_2	35.5	2
+"""
+
+from collections import Counter
+from typing import Any, Optional
+
+__all__ = ["encode_result", "fit_rows"]
+
+# Rough estimate of the length of a token, the exact count is not worth a tokenizer call per tool result
+CHARS_PER_TOKEN = 4
+
+# Most frequent values listed per text column in a summary
+SUMMARY_TOP_VALUES = 5
+
+
+def format_cell(value: Any, decimals: int) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return f"{value:.{decimals}f}".rstrip("0").rstrip(".")
+    # Tabs and line breaks inside a value would break the table
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def count_rows(rows: int) -> str:
+    return "1 row" if rows == 1 else f"{rows} rows"
+
+
+def encode_result(
+    columns: list[str],
+    rows: list[list],
+    token_budget: Optional[int] = None,
+    decimals: int = 2,
+) -> str:
+    """
+    Encodes the result of a query as a compact table, or as a summary if the table exceeds the token budget.
+
+    Args:
+        columns (list[str]): The column names of the result.
+        rows (list[list]): The rows of the result, in the same order as the columns.
+        token_budget (int): The maximum number of tokens of the table, None never summarizes.
+        decimals (int): The number of decimals floats are rounded to.
+
+    Returns:
+        str: The row count, the constant columns, then the header and the rows separated by tabs, or the summary.
+    """
+    cells = [[format_cell(value, decimals) for value in row] for row in rows]
+    lines = [count_rows(len(cells))]
+
+    # Columns holding a single value are given once, when there is more than one row to save on
+    kept = list(range(len(columns)))
+    if len(cells) > 1:
+        constant = [i for i in kept if all(row[i] == cells[0][i] for row in cells)]
+        if len(constant) < len(columns):
+            kept = [i for i in kept if i not in constant]
+            lines.extend(f"{columns[i]}: {cells[0][i]} (every row)" for i in constant)
+
+    counts = Counter(tuple(row[i] for i in kept) for row in cells)
+    header = [columns[i] for i in kept]
+    has_duplicates = len(counts) < len(cells)
+    if has_duplicates:
+        header.append("(count)")
+
+    lines.append("\t".join(header))
+    for row, count in counts.items():
+        lines.append("\t".join(row + ((str(count),) if has_duplicates else ())))
+
+    table = "\n".join(lines)
+    if token_budget is None or estimate_tokens(table) <= token_budget:
+        return table
+    return summarize_result(columns, rows, cells, lines, token_budget, decimals)
+
+
+def summarize_result(
+    columns: list[str],
+    rows: list[list],
+    cells: list[list[str]],
+    table_lines: list[str],
+    token_budget: int,
+    decimals: int,
+) -> str:
+    """
+    Summarizes a result too long for its token budget: the row count, the range of the numeric columns, the most
+    frequent values of the other columns, and the leading lines of the table that fit in the rest of the budget.
+    """
+    lines = [
+        f"{count_rows(len(rows))}, too many to show them all. Summary of every row:"
+    ]
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows if row[index] is not None]
+        numbers = [v for v in values if isinstance(v, (int, float))]
+        if values and len(numbers) == len(values):
+            lines.append(
+                f"{column}: min {format_cell(float(min(numbers)), decimals)}, "
+                f"max {format_cell(float(max(numbers)), decimals)}, "
+                f"mean {format_cell(sum(numbers) / len(numbers), decimals)}"
+            )
+        else:
+            counter = Counter(row[index] for row in cells)
+            top = ", ".join(
+                f"{value} ({count})"
+                for value, count in counter.most_common(SUMMARY_TOP_VALUES)
+            )
+            lines.append(f"{column}: {len(counter)} distinct values, top {top}")
+
+    summary = "\n".join(lines)
+    # The first table line is the row count, already given by the summary
+    remaining = token_budget - estimate_tokens(summary) - 10
+    shown = []
+    for line in table_lines[1:]:
+        remaining -= estimate_tokens(line)
+        if remaining < 0:
+            break
+        shown.append(line)
+    if len(shown) > 1:
+        summary += "\nFirst lines:\n" + "\n".join(shown)
+    return summary
+
+
+def fit_rows(
+    columns: list[str], rows: list[list], token_budget: int, decimals: int = 2
+) -> int:
+    """
+    Finds how many leading rows fit in the token budget once encoded, at least one.
+
+    Args:
+        columns (list[str]): The column names of the result.
+        rows (list[list]): The rows of the result, in the same order as the columns.
+        token_budget (int): The maximum number of tokens of the table.
+        decimals (int): The number of decimals floats are rounded to.
+
+    Returns:
+        int: The number of leading rows whose table fits.
+    """
+
+    def fits(count: int) -> bool:
+        return (
+            estimate_tokens(encode_result(columns, rows[:count], None, decimals))
+            <= token_budget
+        )
+
+    if fits(len(rows)):
+        return len(rows)
+    # The encoded size grows with the rows, but not strictly, merged duplicates cost one line
+    low, high = 1, len(rows) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
@@ -3,65 +3,167 @@ Module Overview
 ---------------
 This module is designed to create and configure a SQLite database for an SQL agent using LangChain.
 It includes functionality for reading CSV files into the database, checking the health of database tables,
-and executing SQL queries.
+and executing SQL queries on a pool of read-only connections.
 
 Structure
 ---------
 - Imports: Necessary libraries and modules.
-- Global Variables: Paths and settings for database and CSV files.
+- Global Variables: Paths and settings for database and CSV files, configurable with the `SQL_AGENT_DB_PATH` and
+  `SQL_AGENT_CSV_FOLDER` environment variables.
 - Functions: Functions for database connections, executing queries, and table health checks.
-- Initialization: Steps to create and populate the database, and initialize the SQL agent.
+- Result Cache: An LRU cache of tool results keyed on normalized queries, invalidated whenever the tables are reloaded.
+- Query Rewriting: Queries are validated and rewritten by `src.tools.sql_parser.QueryRewriter` before running.
+- Result Encoding: Tool results are encoded as a compact table, or summarized past `SQL_RESULT_TOKEN_BUDGET` tokens
+  (see `src.tools.result_encoder`).
+- Query Guard: Tool queries are aborted past `SQL_QUERY_TIMEOUT_SECONDS`, and their results are cut in pages of
+  `SQL_MAX_RESULT_ROWS` rows continued with a page token. Failed and aborted queries are reported to the agent as
+  tool errors it can correct.
+- Query Backends: Tool queries run on SQLite, or on DuckDB over the same CSV files when `SQL_BACKEND=duckdb`
+  (see `src.database.backends`).
+- Initialization: Steps to create the database, ingest the CSV files that changed (see `src.database.ingest`), and
+  initialize the SQL agent. Concurrent processes build the tables once, under a file lock, and with `MULTI_PROCESS`
+  each of them picks up the tables rebuilt by another one through the schema version of the database.
 
 Example Usage:
-    from src.database import get_connection, get_cursor, execute, ping_table, sql_tool
+    from src.tools.sql import get_connection, execute, ping_table, sql_tool
 
-    # Establishing a connection
+    # Establishing a read-write connection, used to load the tables
     connection = get_connection()
 
-    # Getting a cursor
-    connection, cursor = get_cursor()
-
-    # Executing a query
-    connection, cursor = execute("SELECT * FROM allocations")
+    # Executing a read-only query on a pooled connection
+    columns, rows = execute("SELECT * FROM allocations")
 
     # Pinging a table to check its health
     ping_table("allocations")
 
-    # Running a custom SQL query using the sql_tool function
+    # Reloading the tables whose CSV file changed, which also invalidates the result cache
+    load_tables()
+
+    # Running a query and getting its columns and rows, with null values replaced
+    columns, rows = run_query("SELECT * FROM allocations WHERE 'Target Portfolio' = 'Balanced'")
+
+    # Running a custom SQL query using the sql_tool function, at most SQL_MAX_RESULT_ROWS rows are returned
     result = sql_tool("SELECT * FROM allocations WHERE 'Target Portfolio' = 'Balanced'")
+
+    # Getting the next rows with the page_token ending a truncated result
+    result = sql_tool("SELECT * FROM allocations WHERE 'Target Portfolio' = 'Balanced'", page_token="3f1c0e9a2b7d-200")
+
+    # Running the same query from async code without blocking the event loop
+    result = await async_sql_tool("SELECT * FROM allocations WHERE 'Target Portfolio' = 'Balanced'")
 """
 
-import ast
+import asyncio
+import hashlib
 import os
-import re
 import sqlite3
-
-import pandas as pd
-from langchain_community.utilities import SQLDatabase
-
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import sqlglot
+from langchain_core.tools import ToolException
+
+from src.config import (
+    DUCKDB_THREADS,
+    INGEST_CHUNK_ROWS,
+    MULTI_PROCESS,
+    SQL_AGENT_CSV_FOLDER,
+    SQL_AGENT_DB_PATH,
+    SQL_BACKEND,
+    SQL_CACHE_MAX_ENTRIES,
+    SQL_EXPLAIN_QUERY_PLAN,
+    SQL_INGEST_ON_STARTUP,
+    SQL_MAX_RESULT_ROWS,
+    SQL_POOL_SIZE,
+    SQL_QUERY_MAX_VM_STEPS,
+    SQL_QUERY_TIMEOUT_SECONDS,
+    SQL_RESULT_DECIMALS,
+    SQL_RESULT_TOKEN_BUDGET,
+    SQLITE_CACHE_SIZE_KIB,
+    SQLITE_MMAP_SIZE,
+)
+from src.database import (
+    TABLE_SCHEMAS,
+    TABLE_SOURCES,
+    DuckDBBackend,
+    QueryBackend,
+    QueryError,
+    QueryTimeoutError,
+    SQLiteBackend,
+    SQLiteConnectionPool,
+    ingest_lock,
+    ingest_tables,
+)
 from src.logger.logger import l
+from src.metrics import span
+from src.tools.result_encoder import encode_result, fit_rows
+from src.tools.sql_parser import QueryRewriter
 
 
 def get_connection():
-    return sqlite3.connect(db_path)
+    """
+    Opens a read-write connection to the database, only used to load the tables, queries go through the pool.
+    """
+    connection = sqlite3.connect(db_path)
+    # WAL lets the pooled readers keep querying while the tables are being written
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
 
 
-def get_cursor():
-    connection = get_connection()
-    return connection, connection.cursor()
+def execute(query: str) -> tuple[list[str], list[tuple]]:
+    """
+    Executes a read-only query on a pooled connection.
 
+    Args:
+        query (str): The SQL query to be executed.
 
-def execute(query: str):
-    connection, cursor = get_cursor()
-    cursor.execute(query)
-    connection.commit()
-    return connection, cursor
+    Returns:
+        tuple[list[str], list[tuple]]: The column names and the rows of the result.
+    """
+    return sqlite_backend.execute(query)
+
+
+def create_query_backend() -> QueryBackend:
+    """
+    Creates the backend the SQL tool runs its queries on, selected with the `SQL_BACKEND` environment variable.
+
+    Returns:
+        QueryBackend: The SQLite backend, or the DuckDB backend loaded from the same CSV files.
+    """
+    if SQL_BACKEND == "duckdb":
+        return DuckDBBackend(
+            csv_folder, TABLE_SOURCES, TABLE_SCHEMAS, threads=DUCKDB_THREADS
+        )
+    if SQL_BACKEND != "sqlite":
+        raise ValueError(f"Unknown SQL backend {SQL_BACKEND}, use sqlite or duckdb")
+    return sqlite_backend
+
+
+def explain_query_plan(query: str) -> list[str]:
+    """
+    Logs the query plan of a query and warns about the full table scans it contains.
+
+    Args:
+        query (str): The SQL query to explain.
+
+    Returns:
+        list[str]: The steps of the query plan.
+    """
+    _, rows = execute(f"EXPLAIN QUERY PLAN {query}")
+    steps = [row[-1] for row in rows]
+    for step in steps:
+        # Scans through an index are fine, only scans of the whole table are flagged
+        if step.startswith("SCAN") and "USING" not in step:
+            l.warning(f"Full table scan ({step}) in query: {query}")
+        else:
+            l.info(f"Query plan step: {step}")
+    return steps
 
 
 def ping_table(table_name: str):
-    connection, cursor = execute(f"SELECT * FROM {table_name} LIMIT 1")
     try:
-        rows = cursor.fetchmany(1)
+        _, rows = execute(f"SELECT * FROM {table_name} LIMIT 1")
         if rows and len(rows) == 1:
             l.info(f"Table {table_name} is healthy")
         else:
@@ -72,186 +174,440 @@ def ping_table(table_name: str):
     except Exception as e:
         l.error(f"Error pinging table {table_name}: {e}")
         raise e
-    finally:
-        cursor.close()
-        connection.close()
 
 
-l.info("Initializing SQLAgent")
-path = "/Users/miguelpinheiro/projects/interview"
-db_name = "database"
-csv_folder = "data"
-db_path = f"{path}/{db_name}.db"
-chat_history = {}
-
-l.info(f"Creating database {db_name} in {path}")
-os.makedirs(os.path.dirname(db_path), exist_ok=True)
-
-l.info(f"Connecting to database {db_name}")
-connection = sqlite3.connect(db_path)
-
-l.info("Reading CSV files")
-allocations = pd.read_csv(f"{csv_folder}/client_target_allocations.csv")
-advisors_clients = pd.read_csv(f"{csv_folder}/financial_advisor_clients.csv")
-
-l.info("Writing CSV files to database")
-allocations.to_sql("allocations", connection, if_exists="replace", index=False)
-advisors_clients.to_sql(
-    "advisors_clients", connection, if_exists="replace", index=False
-)
+class QueryResultCache:
+    """
+    Size bounded LRU cache of SQL tool results keyed on the normalized form of the query.
 
-connection.close()
+    Attributes:
+        max_entries (int): The maximum number of results kept, the least recently used one is evicted first.
+        hits (int): The number of lookups that found a result.
+        misses (int): The number of lookups that did not find a result.
+    """
 
-l.info("Running health check on created tables")
-ping_table("allocations")
-ping_table("advisors_clients")
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._results: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: str) -> None:
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# The LLM sends the same queries again and again, e.g. when a user retries, they are parsed once
+@lru_cache(maxsize=1024)
+def normalize_query(query: str) -> str:
+    """
+    Normalizes an SQL query so that queries differing only in whitespace, keyword case, identifier quoting style or
+    a trailing semicolon share a cache key.
 
-l.info("Initializing SQL Database tool")
-db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
+    The query is parsed and rendered again, so string literals and quoted identifiers are kept exactly as written.
 
-tables_columns = {
-    "allocations": list(allocations.columns),
-    "advisors_clients": list(advisors_clients.columns),
-}
+    Args:
+        query (str): The SQL query to normalize.
 
+    Returns:
+        str: The normalized SQL query.
 
-def extract_columns(query: str) -> list[str]:
+    Example:
+        normalize_query("select `Client`  FROM allocations WHERE `Asset Class` = 'Stocks';")
+        # Output: 'SELECT "Client" FROM allocations WHERE "Asset Class" = \'Stocks\''
     """
-    Extracts the column names from a SQL SELECT query.
+    try:
+        return sqlglot.parse_one(query, read="sqlite").sql(dialect="sqlite")
+    except sqlglot.errors.SqlglotError:
+        # The query is rejected when it runs, its key only needs to be stable
+        return query.strip().rstrip(";").strip()
+
+
+def get_tables_columns() -> dict[str, list[str]]:
+    """
+    Reads the columns of each ingested table from the database.
+
+    Returns:
+        dict[str, list[str]]: The columns of each table, in table order.
+    """
+    tables_columns = {}
+    for table in TABLE_SOURCES:
+        columns, _ = execute(f'SELECT * FROM "{table}" LIMIT 0')
+        tables_columns[table] = columns
+    return tables_columns
+
+
+def get_categorical_values(max_distinct: int = 32) -> frozenset[str]:
+    """
+    Returns the values of the text columns with few distinct values, e.g. the asset classes, sectors, asset names and
+    symbols, read again only when the tables are rebuilt.
 
     Args:
-        query (str): The SQL SELECT query.
+        max_distinct (int): Text columns with more distinct values, e.g. the clients, are left out.
 
     Returns:
-        list[str]: A list of column names extracted from the query.
+        frozenset[str]: The values of the categorical columns.
     """
-    pattern = re.compile(
-        r"SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM", re.IGNORECASE | re.DOTALL
-    )
-    match = pattern.search(query)
-    if not match:
-        return []
+    return read_categorical_values(schema_version, max_distinct)
 
-    columns_string = match.group(1)
 
-    column_pattern = re.compile(r"`([^`]+)`|(\b\w+\b(?:,\s*\w+\b)*)")
-    matches = column_pattern.findall(columns_string)
-    columns = []
-    for match in matches:
-        if match[0]:
-            columns.append(match[0])
-        elif match[1]:
-            columns.extend(match[1])
+@lru_cache(maxsize=1)
+def read_categorical_values(
+    version: Optional[int], max_distinct: int
+) -> frozenset[str]:
+    values = set()
+    for table, columns in tables_columns.items():
+        _, types = execute(
+            f"SELECT name, type FROM pragma_table_info('{table.replace(chr(39), chr(39) * 2)}')"
+        )
+        for column, column_type in types:
+            if column not in columns or column_type.upper() != "TEXT":
+                continue
+            _, rows = execute(
+                f'SELECT DISTINCT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL LIMIT {max_distinct + 1}'
+            )
+            if len(rows) <= max_distinct:
+                values.update(str(row[0]) for row in rows)
+    return frozenset(values)
 
-    return columns
 
+def load_tables(force: bool = False, ingest: bool = True):
+    """
+    Loads the CSV files that changed since the last ingest into the database, checks the health of the tables and
+    invalidates the result cache if any table was rebuilt.
+    The ingest holds a lock next to the database, so concurrent processes build the tables once.
 
-def replace_null_values(columns: list, result: pd.DataFrame) -> str:
+    Args:
+        force (bool): Rebuild every table, even the ones whose CSV file did not change.
+        ingest (bool): Ingest the CSV files, False only attaches to a database built by another process.
     """
-    Replaces null values in the result list with default values based on the column name.
+    rebuilt_tables = []
+    if ingest:
+        with ingest_lock(f"{db_path}.lock"):
+            l.info(f"Connecting to database {db_path}")
+            connection = get_connection()
+            try:
+                rebuilt_tables = ingest_tables(
+                    connection, csv_folder, force=force, chunk_rows=INGEST_CHUNK_ROWS
+                )
+            finally:
+                connection.close()
+    else:
+        l.info(f"Attaching to database {db_path} without ingesting")
+
+    l.info("Running health check on tables")
+    for table in TABLE_SOURCES:
+        ping_table(table)
+
+    attach_tables(rebuilt_tables)
+
+
+def attach_tables(rebuilt_tables: list[str]):
+    """
+    Reads the columns of the tables, and prepares the query backend, the query rewriter and the result cache for them.
 
     Args:
-        columns (list): A list of column names.
-        result (str): A string representation of a list containing the query result.
+        rebuilt_tables (list[str]): The tables rebuilt since they were last attached.
+    """
+    global tables_columns, query_rewriter, query_backend, schema_version
 
-    Returns:
-        str: A string representation of the updated result list with null values replaced.
+    # Read first, so a rebuild happening meanwhile is picked up by the next check
+    schema_version = read_schema_version()
+    tables_columns = get_tables_columns()
 
-    Example:
-        columns = ["Target Portfolio", "Asset Class", "Client"]
-        result = '[[None, "Stocks", "John Doe"], ["Aggressive", None, "Unknown Client"]]'
-        replace_null_values(columns, result)
-        # Output: '[[Conservative, Stocks, John Doe], [Aggressive, Cash, Unknown Client]]'
+    if query_backend is None:
+        l.info(f"Initializing {SQL_BACKEND} query backend")
+        query_backend = create_query_backend()
+    elif rebuilt_tables:
+        query_backend.reload()
+
+    query_rewriter = QueryRewriter(
+        tables_columns, default_values, dialect=query_backend.dialect
+    )
+
+    if rebuilt_tables:
+        l.info(f"Invalidating SQL result cache, rebuilt tables: {rebuilt_tables}")
+        result_cache.clear()
+
+
+def read_schema_version() -> int:
+    # Incremented by SQLite whenever a table or an index is created or dropped, by any process
+    _, rows = execute("PRAGMA schema_version")
+    return rows[0][0]
+
+
+def refresh_if_tables_changed():
+    """
+    Picks up the tables rebuilt by another process, e.g. a restarted worker that ingested changed CSV files, and
+    invalidates the result cache of this process. Only needed when several processes share the database.
     """
-    default_values = {
-        "Target Portfolio": "Conservative",
-        "Asset Class": "Cash",
-        "Client": "Unknown Client",
-        "Target Allocation (%)": 0,
-        "Sector": "Unknown Sector",
-        "Analyst Rating": "Hold",
-        "Risk Level": "Medium",
-    }
+    if read_schema_version() == schema_version:
+        return
+    with refresh_lock:
+        if read_schema_version() != schema_version:
+            l.info("Tables rebuilt by another process, attaching them again")
+            attach_tables(list(TABLE_SOURCES))
+
+
+default_values = {
+    "Target Portfolio": "Conservative",
+    "Asset Class": "Cash",
+    "Client": "Unknown Client",
+    "Target Allocation (%)": 0,
+    "Sector": "Unknown Sector",
+    "Analyst Rating": "Hold",
+    "Risk Level": "Medium",
+}
 
-    # Convert string representation of list to actual list
-    result_list = ast.literal_eval(result)
+l.info("Initializing SQLAgent")
+db_path = SQL_AGENT_DB_PATH
+csv_folder = SQL_AGENT_CSV_FOLDER
+result_cache = QueryResultCache(SQL_CACHE_MAX_ENTRIES)
+tables_columns: dict[str, list[str]] = {}
+query_rewriter: QueryRewriter
+query_backend: Optional[QueryBackend] = None
+schema_version: Optional[int] = None
+refresh_lock = threading.Lock()
+
+l.info(f"Creating database {db_path}")
+if os.path.dirname(db_path):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+connection_pool = SQLiteConnectionPool(
+    db_path,
+    max_connections=SQL_POOL_SIZE,
+    mmap_size=SQLITE_MMAP_SIZE,
+    cache_size_kib=SQLITE_CACHE_SIZE_KIB,
+)
+sqlite_backend = SQLiteBackend(connection_pool, max_vm_steps=SQL_QUERY_MAX_VM_STEPS)
 
-    # Create DataFrame from result list
-    df = pd.DataFrame(result_list, columns=columns)
+load_tables(ingest=SQL_INGEST_ON_STARTUP)
 
-    # Fill null values using the default_values dictionary
-    for column, default_value in default_values.items():
-        if column in df.columns:
-            df[column] = df[column].fillna(default_value)
 
-    # Convert DataFrame back to list of lists
-    updated_result_list = df.values.tolist()
+def replace_null_values(columns: list[str], rows: list[tuple]) -> list[list]:
+    """
+    Replaces null values in the result rows with default values based on the column name, in a single pass.
 
-    return str(updated_result_list)
+    Args:
+        columns (list[str]): The column names of the result, in the same order as the values of each row.
+        rows (list[tuple]): The rows of the query result.
 
+    Returns:
+        list[list]: The rows with null values replaced.
 
-def update_select_columns(query: str, table: str) -> str:
+    Example:
+        columns = ["Target Portfolio", "Asset Class", "Client"]
+        rows = [(None, "Stocks", "John Doe"), ("Aggressive", None, None)]
+        replace_null_values(columns, rows)
+        # Output: [['Conservative', 'Stocks', 'John Doe'], ['Aggressive', 'Cash', 'Unknown Client']]
+    """
+    defaults = [
+        (index, default_values[column])
+        for index, column in enumerate(columns)
+        if column in default_values
+    ]
+
+    updated_rows = []
+    for row in rows:
+        row = list(row)
+        for index, default_value in defaults:
+            if row[index] is None:
+                row[index] = default_value
+        updated_rows.append(row)
+
+    return updated_rows
+
+
+def run_query(
+    query: str, max_rows: Optional[int] = None, offset: int = 0
+) -> tuple[list[str], list[list]]:
     """
-    Updates the SELECT statement in the given SQL query to include all columns from the specified table.
+    Validates, rewrites and executes an SQL query within the time budget of the tool queries, and replaces the null
+    values of its result.
 
     Args:
-        query (str): The SQL query to update.
-        table (str): The name of the table.
+        query (str): The SQL query to be executed.
+        max_rows (int): The maximum number of rows returned, None returns every row.
+        offset (int): The number of leading rows of the result skipped.
 
     Returns:
-        str: The updated SQL query with the SELECT statement modified to include all columns from the table.
+        tuple[list[str], list[list]]: The column names and the rows of the result.
+
+    Raises:
+        ToolException: If the query is not a valid read only query, ran past its budget or failed.
     """
-    if f"SELECT * FROM `{table}`" in query or f"SELECT * FROM {table}" in query:
-        backticked_columns = ", ".join(f"`{col}`" for col in tables_columns[table])
+    if MULTI_PROCESS:
+        refresh_if_tables_changed()
+    # Rejects anything but SELECT, expands wildcards and replaces null values in SQL
+    with span("sql_rewrite"):
+        query = query_rewriter.rewrite(query).sql
+    l.debug(f"Running SQL Tool with query: {query}")
+    if SQL_EXPLAIN_QUERY_PLAN and query_backend.dialect == "sqlite":
+        explain_query_plan(query)
+    try:
+        with span("sql_execute"):
+            columns, rows = query_backend.execute(
+                query,
+                max_rows=max_rows,
+                offset=offset,
+                timeout=SQL_QUERY_TIMEOUT_SECONDS,
+            )
+    except QueryTimeoutError as e:
+        l.warning(f"SQL Tool query aborted: {query}")
+        raise ToolException(
+            f"{e} Make the query cheaper: filter the rows, avoid joins without a join condition, "
+            "or aggregate in SQL."
+        ) from e
+    except QueryError as e:
+        raise ToolException(f"The query failed: {e}") from e
+    with span("replace_null_values"):
+        rows = replace_null_values(columns, rows)
+    return columns, rows
+
+
+def make_page_token(query: str, offset: int) -> str:
+    """
+    Builds the continuation token of a result page, tied to the query so it cannot be used with another one.
 
-        query = query.replace(
-            f"SELECT * FROM `{table}`",
-            f"SELECT {str(backticked_columns)} FROM `{table}`",
-        )
+    Args:
+        query (str): The SQL query of the result.
+        offset (int): The number of rows of the result already returned.
 
-        query = query.replace(
-            f"SELECT * FROM {table}",
-            f"SELECT {str(backticked_columns)} FROM {table}",
-        )
-    return query
+    Returns:
+        str: The continuation token.
+
+    Example:
+        make_page_token('SELECT "Client" FROM allocations', 200)
+        # Output: '3f1c0e9a2b7d-200'
+    """
+    digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:12]
+    return f"{digest}-{offset}"
 
 
-def replace_wildcard(query: str) -> str:
+def read_page_token(query: str, page_token: Optional[str]) -> int:
     """
-    Replaces the wildcard in the given SQL query with the appropriate select columns.
+    Reads the offset of a continuation token.
 
     Args:
-        query (str): The SQL query to be modified.
+        query (str): The SQL query the token is used with.
+        page_token (str): The continuation token, None for the first page.
 
     Returns:
-        str: The modified SQL query with the wildcard replaced.
+        int: The number of rows to skip.
 
+    Raises:
+        ToolException: If the token is malformed or belongs to another query.
     """
-    if "FROM allocations" in query or "FROM `allocations`" in query:
-        query = update_select_columns(query, "allocations")
-    elif "FROM advisors_clients" in query or "FROM `advisors_clients`" in query:
-        query = update_select_columns(query, "advisors_clients")
-    return query
+    if not page_token:
+        return 0
+    _, _, offset = page_token.strip().rpartition("-")
+    if (
+        not offset.isdigit()
+        or make_page_token(query, int(offset)) != page_token.strip()
+    ):
+        raise ToolException(
+            "The page_token does not belong to this query, send the exact same query with the page_token of its "
+            "previous page."
+        )
+    return int(offset)
 
 
-def sql_tool(query: str):
+def sql_tool(query: str, page_token: Optional[str] = None):
     """
     Executes an SQL query using the provided query string.
+    Long results are split in pages, a truncated result ends with the page_token of the next page.
 
     Args:
         query (str): The SQL query to be executed.
+        page_token (str): The page_token returned with the previous page of the same query, to get the next rows.
 
     Returns:
         The result of the SQL query execution.
     """
-    query = replace_wildcard(query)
-    l.info(f"Running SQL Tool with query: {query}")
-    result = db.run(query)
+    offset = read_page_token(query, page_token)
+    cache_key = normalize_query(query)
+    if offset:
+        cache_key = f"{cache_key}#{offset}"
+    cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        l.debug(f"Serving SQL Tool query from cache: {query}")
+        return cached_result
+
+    # One more row than shown tells whether the result continues
+    columns, rows = run_query(query, max_rows=SQL_MAX_RESULT_ROWS + 1, offset=offset)
+    has_more = len(rows) > SQL_MAX_RESULT_ROWS
+    rows = rows[:SQL_MAX_RESULT_ROWS]
+
+    if not rows:
+        if offset:
+            result = "No more results, every row of the query was already returned."
+        else:
+            result = "No results found in the database. Please try another query."
+    else:
+        token_budget = SQL_RESULT_TOKEN_BUDGET
+        if has_more or offset:
+            # A summary would only cover this page, the page is cut to the rows that fit and the next one starts there
+            shown = fit_rows(columns, rows, token_budget, SQL_RESULT_DECIMALS)
+            has_more = has_more or shown < len(rows)
+            rows = rows[:shown]
+            token_budget = None
+
+        # The result is serialized only once, after the null values are replaced, in a compact form since it is
+        # sent back to the LLM on every following iteration
+        result = encode_result(
+            columns,
+            rows,
+            token_budget=token_budget,
+            decimals=SQL_RESULT_DECIMALS,
+        )
+        if has_more:
+            result += (
+                f"\n\nOnly rows {offset + 1} to {offset + len(rows)} are shown, the query returned more. "
+                "Filter or aggregate the query if the answer does not need every row, or call the tool again with "
+                f'the same query and page_token="{make_page_token(query, offset + len(rows))}" to get the next rows.'
+            )
 
-    if not result:
-        return "No results found in the database. Please try another query."
+    result_cache.put(cache_key, result)
+    return result
 
-    ordered_columns = extract_columns(query)
-    result = replace_null_values(ordered_columns, result)
 
-    return result
+async def async_sql_tool(query: str, page_token: Optional[str] = None):
+    """
+    Executes an SQL query using the provided query string without blocking the event loop.
+    Long results are split in pages, a truncated result ends with the page_token of the next page.
+
+    Args:
+        query (str): The SQL query to be executed.
+        page_token (str): The page_token returned with the previous page of the same query, to get the next rows.
+
+    Returns:
+        The result of the SQL query execution.
+    """
+    return await asyncio.to_thread(sql_tool, query, page_token)
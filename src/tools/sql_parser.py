@@ -0,0 +1,184 @@
+"""
+Module Overview
+---------------
+This module provides the SQL rewriting layer used by the SQL tool, built on the sqlglot parser with the SQLite dialect.
+A query generated by the LLM is parsed once and, from that single parse, the rewriter rejects anything that is not a
+read only query, expands the `*` wildcard into the table columns, resolves the output column names and wraps the
+columns that have a default value in `COALESCE` so null values are replaced by the database itself.
+The rewritten query is rendered in the dialect of the backend running it and cached per query string, so the LLM
+repeating a query costs nothing.
+
+Structure
+---------
+- Imports: Necessary libraries and modules.
+- Data Models: The result of rewriting a query.
+- Classes: The query rewriter.
+
+Example usage:
+    from src.tools.sql_parser import QueryRewriter
+
+    rewriter = QueryRewriter(
+        tables_columns={"allocations": ["Client", "Target Portfolio", "Asset Class", "Target Allocation (%)"]},
+        default_values={"Client": "Unknown Client"},
+    )
+
+    parsed = rewriter.rewrite("SELECT * FROM allocations")
+    parsed.sql
+    # Output: 'SELECT COALESCE("Client", \'Unknown Client\') AS "Client", "Target Portfolio", ... FROM allocations'
+    parsed.columns
+    # Output: ('Client', 'Target Portfolio', 'Asset Class', 'Target Allocation (%)')
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+import sqlglot
+from langchain_core.tools import ToolException
+from sqlglot import exp
+
+__all__ = ["ParsedQuery", "QueryRewriter"]
+
+DIALECT = "sqlite"
+FORBIDDEN_EXPRESSIONS = (exp.DML, exp.DDL, exp.Drop, exp.Alter, exp.Command)
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class ParsedQuery(NamedTuple):
+    """
+    The result of rewriting a query.
+
+    Attributes:
+        sql (str): The rewritten SQL query, ready to be executed.
+        columns (tuple[str, ...]): The names of the output columns, in order.
+    """
+
+    sql: str
+    columns: tuple[str, ...]
+
+
+class QueryRewriter:
+    """
+    Parses and rewrites the SQL queries generated by the LLM against a known schema.
+
+    Attributes:
+        tables_columns (dict[str, list[str]]): The columns of each table, in table order.
+        default_values (dict[str, Any]): The value replacing nulls for each column name.
+        dialect (str): The sqlglot dialect rewritten queries are rendered in, queries are always read as SQLite.
+    """
+
+    def __init__(
+        self,
+        tables_columns: dict[str, list[str]],
+        default_values: dict[str, Any],
+        dialect: str = DIALECT,
+        cache_size: int = 1024,
+    ):
+        self.tables_columns = {
+            table.lower(): columns for table, columns in tables_columns.items()
+        }
+        self.default_values = default_values
+        self.dialect = dialect
+        self.rewrite = lru_cache(maxsize=cache_size)(self._rewrite)
+
+    def _rewrite(self, query: str) -> ParsedQuery:
+        """
+        Parses a query, validates it is read only, expands wildcards and injects default values for nulls.
+
+        Args:
+            query (str): The SQL query to rewrite.
+
+        Returns:
+            ParsedQuery: The rewritten query and its output column names.
+
+        Raises:
+            ToolException: If the query is not valid SQL or is not a single read only query.
+        """
+        try:
+            statements = [s for s in sqlglot.parse(query, read=DIALECT) if s]
+        except sqlglot.errors.SqlglotError as e:
+            # Unterminated strings fail in the tokenizer, the rest in the parser, which underlines the error with
+            # terminal escapes the model has no use for
+            raise ToolException(
+                f"The query is not valid SQL: {ANSI_ESCAPE_PATTERN.sub('', str(e))}"
+            )
+
+        if len(statements) != 1:
+            raise ToolException("Only a single SELECT statement is allowed per query.")
+
+        expression = statements[0]
+        if not isinstance(expression, exp.Query) or expression.find(
+            *FORBIDDEN_EXPRESSIONS
+        ):
+            raise ToolException(
+                "Only SELECT statements are allowed, DML and DDL statements are rejected."
+            )
+
+        if not isinstance(expression, exp.Select):
+            return ParsedQuery(
+                expression.sql(dialect=self.dialect), tuple(expression.named_selects)
+            )
+
+        projections = self._expand_wildcards(expression)
+        columns = tuple(projection.alias_or_name for projection in projections)
+        expression.set(
+            "expressions",
+            [self._with_default(projection) for projection in projections],
+        )
+
+        return ParsedQuery(expression.sql(dialect=self.dialect), columns)
+
+    def _expand_wildcards(self, select: exp.Select) -> list[exp.Expression]:
+        # Tables in the FROM and JOIN clauses, in order, as (qualifier, table name)
+        sources = []
+        # Recent sqlglot versions store the FROM clause under "from_"
+        from_clause = select.args.get("from_") or select.args.get("from")
+        for clause in [from_clause, *(select.args.get("joins") or [])]:
+            table = clause.this if clause is not None else None
+            if isinstance(table, exp.Table):
+                sources.append((table.alias_or_name, table.name.lower()))
+
+        projections = []
+        for projection in select.expressions:
+            if isinstance(projection, exp.Star):
+                matches = sources
+                qualify = len(sources) > 1
+            elif isinstance(projection, exp.Column) and isinstance(
+                projection.this, exp.Star
+            ):
+                matches = [
+                    source
+                    for source in sources
+                    if source[0].lower() == projection.table.lower()
+                ]
+                qualify = True
+            else:
+                projections.append(projection)
+                continue
+
+            if not matches or any(
+                table not in self.tables_columns for _, table in matches
+            ):
+                # Unknown tables, e.g. CTEs or subqueries, are left for the database to expand
+                projections.append(projection)
+                continue
+
+            for qualifier, table in matches:
+                projections.extend(
+                    exp.column(
+                        column, table=qualifier if qualify else None, quoted=True
+                    )
+                    for column in self.tables_columns[table]
+                )
+
+        return projections
+
+    def _with_default(self, projection: exp.Expression) -> exp.Expression:
+        column = projection.this if isinstance(projection, exp.Alias) else projection
+        if not isinstance(column, exp.Column) or column.name not in self.default_values:
+            return projection
+
+        coalesced = exp.func(
+            "COALESCE", column.copy(), exp.convert(self.default_values[column.name])
+        )
+        return exp.alias_(coalesced, projection.alias_or_name, quoted=True)
@@ -0,0 +1,79 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration
+
+from src.cache.llm_cache import SQLiteLLMCache, question_entities
+
+CATEGORICAL_VALUES = frozenset(
+    {"Stocks", "Bonds", "ETFs", "Cash", "Tesla Inc.", "Apple Inc.", "TSLA", "AAPL"}
+)
+
+DIFFERENT_QUESTIONS = [
+    (
+        "What is the target allocation of stocks for Client_1?",
+        "What is the target allocation of bonds for Client_1?",
+    ),
+    (
+        "What is the target allocation of stocks for Client_1?",
+        "What is the target allocation of stocks for Client_2?",
+    ),
+    ("Which clients are holding Tesla?", "Which clients are holding Apple?"),
+    (
+        "Which assets of Client_1 have a target allocation smaller than 40%?",
+        "Which assets of Client_1 have a target allocation greater than 40%?",
+    ),
+]
+
+
+class ConstantEmbeddings(Embeddings):
+    """
+    Embeds every text to the same vector, so only the entities tell two questions apart.
+    """
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0, 0.0]
+
+
+def prompt(question: str) -> str:
+    return dumps(
+        [SystemMessage("You are a financial advisor."), HumanMessage(question)]
+    )
+
+
+def test_entities_tell_apart_questions_differing_in_one_entity():
+    for first, second in DIFFERENT_QUESTIONS:
+        assert question_entities(first, CATEGORICAL_VALUES) != question_entities(
+            second, CATEGORICAL_VALUES
+        )
+
+
+def test_entities_match_for_rephrased_questions():
+    assert question_entities(
+        "Which clients hold tesla stocks?", CATEGORICAL_VALUES
+    ) == question_entities(
+        "Who are the clients holding Tesla stock?", CATEGORICAL_VALUES
+    )
+    assert question_entities(
+        "Assets of client 1 below 40%", CATEGORICAL_VALUES
+    ) == question_entities("Assets of Client_1 smaller than 40 %", CATEGORICAL_VALUES)
+
+
+def test_semantic_tier_only_reuses_answers_with_the_same_entities(tmp_path):
+    cache = SQLiteLLMCache(
+        str(tmp_path / "llm_cache.db"),
+        embeddings=ConstantEmbeddings(),
+        categorical_values=lambda: CATEGORICAL_VALUES,
+    )
+    for first, second in DIFFERENT_QUESTIONS:
+        cache.update(
+            prompt(first), "gpt-4o", [ChatGeneration(message=AIMessage(first))]
+        )
+        assert cache.lookup(prompt(second), "gpt-4o") is None
+
+    hit = cache.lookup(prompt("Which clients hold Tesla?"), "gpt-4o")
+    assert hit is not None
+    assert hit[0].message.content == "Which clients are holding Tesla?"
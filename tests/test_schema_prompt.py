@@ -0,0 +1,61 @@
+import sqlite3
+
+from src.prompts.schema_prompt import CHARS_PER_TOKEN, SchemaPromptCompiler
+
+
+class WordEncoding:
+    """
+    Stands in for a tiktoken encoding, one token per word.
+    """
+
+    def encode(self, text: str) -> list[str]:
+        return text.split(" ")
+
+    def decode(self, tokens: list[str]) -> str:
+        return " ".join(tokens)
+
+
+def make_compiler(token_budget: int) -> SchemaPromptCompiler:
+    compiler = SchemaPromptCompiler(
+        execute=lambda query: ([], []),
+        get_tables_columns=lambda: {},
+        token_budget=token_budget,
+    )
+    compiler._encoding = WordEncoding()
+    return compiler
+
+
+def test_truncate_with_encoding_keeps_the_budget():
+    compiler = make_compiler(token_budget=3)
+
+    assert compiler.truncate("one two three four five") == "one two three"
+    assert compiler.count_tokens(compiler.truncate("one two three four")) == 3
+
+
+def test_truncate_without_encoding_estimates_from_length():
+    compiler = make_compiler(token_budget=2)
+    compiler._encoding = None
+
+    assert compiler.truncate("x" * 20) == "x" * 8
+
+
+def test_render_over_budget_without_encoding_truncates():
+    connection = sqlite3.connect(":memory:")
+    connection.execute('CREATE TABLE allocations ("Client" TEXT, "Asset Class" TEXT)')
+    connection.execute("INSERT INTO allocations VALUES ('Client_1', 'Stocks')")
+
+    def execute(query):
+        cursor = connection.execute(query)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+    compiler = SchemaPromptCompiler(
+        execute=execute,
+        get_tables_columns=lambda: {"allocations": ["Client", "Asset Class"]},
+        token_budget=3,
+    )
+    compiler._encoding = None
+
+    rendered = compiler.render()
+    assert rendered == compiler.compile()
+    # The least detailed schema is cut at the estimated length of the budget
+    assert rendered == "Table allocations:"[: 3 * CHARS_PER_TOKEN]
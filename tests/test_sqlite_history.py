@@ -0,0 +1,57 @@
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.memory.sqlite_history import SQLiteHistoryStore
+
+
+def contents(messages) -> list[str]:
+    return [message.content for message in messages]
+
+
+def test_load_recent_merges_the_queued_messages(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), flush_interval=60)
+    store.append("s1", [HumanMessage("a"), HumanMessage("b")])
+    store.append("s1", [HumanMessage("c")])
+
+    assert contents(store.load_recent("s1", 20)) == ["a", "b", "c"]
+    assert contents(store.load_recent("s1", 2)) == ["b", "c"]
+    assert store.load_recent("s2", 20) == []
+    store.close()
+
+
+def test_load_recent_does_not_wait_for_the_other_sessions(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), flush_interval=60)
+    store.append("busy", [HumanMessage("a")])
+
+    start = time.perf_counter()
+    store.load_recent("new", 20)
+    assert time.perf_counter() - start < 1
+    store.close()
+
+
+def test_clear_hides_the_written_messages(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    store.append("s1", [HumanMessage("a")])
+    store.flush()
+
+    store.clear("s1")
+    store.append("s1", [HumanMessage("b")])
+    assert contents(store.load_recent("s1", 20)) == ["b"]
+
+    store.flush()
+    assert contents(store.load_recent("s1", 20)) == ["b"]
+    store.close()
+
+
+def test_the_interval_runs_from_the_first_queued_operation(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), flush_interval=0.2)
+    start = time.perf_counter()
+    # Steady traffic, each append arrives before the interval of the previous one ends
+    for i in range(10):
+        store.append("s1", [HumanMessage(str(i))])
+        time.sleep(0.05)
+        if store._written_seq:
+            break
+    assert time.perf_counter() - start < 0.4
+    store.close()